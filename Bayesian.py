@@ -1,8 +1,9 @@
 import os
 import json
 import networkx as nx
-import pandas as pd
-import numpy as np
+from method_coverage import load_method_coverage
+from spectrum_store import read_index
+from bn_probability import FailureProbabilityEngine
 
 
 all_bugs = [
@@ -56,61 +57,33 @@ def read_pdg(file_path):
                 graph.add_edge(source, target)
     return graph
 
-def create_bayesian_network(pdg, coverage_df, failing_tests):
-    # if not isinstance(coverage_df, pd.DataFrame):
-    #     raise TypeError("coverage_df must be a pandas DataFrame")
-    X = coverage_df.to_numpy().transpose()
+def create_bayesian_network(pdg, method_coverage, failing_tests, batched=False):
+    """
+    Computes P(Fail|Node) for every PDG node on the failing-test bitmaps of the
+    method coverage (see bn_probability.FailureProbabilityEngine).
+    With batched=True all nodes are computed in one sparse matrix product
+    (FailureProbabilityEngine.failure_probabilities), same probabilities.
+    :param pdg: NetworkX DiGraph of the filtered PDG.
+    :param method_coverage: CoverageStore whose rows are methods.
+    :param failing_tests: Ids of the failing tests.
+    :param batched: True to compute every node at once, for large call graphs.
+    :return: NetworkX DiGraph with a failure_probability attribute per node.
+    """
+    engine = FailureProbabilityEngine(method_coverage, failing_tests)
 
-    # is_failing = np.array([test in failing_tests for test in coverage_df.columns]) 
-    is_failing = [
-    idx for idx, test in enumerate(coverage_df.columns) if test in failing_tests]
-    total_test = len(coverage_df.columns)
     bayesian_network = nx.DiGraph()
-    # print(coverage_df)
-    for node in pdg.nodes:
-        if node not in coverage_df.index:
-            bayesian_network.add_node(node, failure_probability=0.0)
-            continue
-        successors = list(pdg.successors(node))
-        if len(successors) == 0: # 고립된 노드
-            prob = 0
-            a = np.sum(X[is_failing, :][:, [node_index]].any(axis=1))
-            prob = a / total_test
-            bayesian_network.add_node(node, failure_probability = prob)
-            continue
-        
-        # 연결된 노드
-        line_indices = [coverage_df.index.get_loc(line) for line in successors if line in coverage_df.index]
-        node_index = coverage_df.index.get_loc(node)
-        b = total_test - np.sum(X[is_failing, :][:, line_indices].any(axis=1)) # 자식 노드들에서 실패하지 않은 테스트 케이스의 수
-        a = np.sum(X[is_failing, :][:, [node_index] + line_indices].any(axis=1)) - np.sum(X[is_failing, :][:, line_indices].any(axis=1))
-
-        # a=0
-        # b=0
-        # for key, value in all_test.items():
-        #     if not isinstance(value, set):
-        #         value = set(value)
-        #     if value.isdisjoint(successors) or key not in failing_tests:
-        #         b += 1
-
-        # for key, value in all_test.items():
-        #     if not isinstance(value, set):
-        #         value = set(value)
-        #     if value.isdisjoint(successors) and key in failing_tests and node in value:
-        #         a += 1
-
-        # total_test - np.sum(X[is_failing, :][:, line_indices].any(axis=1)) - np.sum(~X[is_failing, :][:, node_index])
-        # 자식 노드들에서 실패하지 않고, 현재 노드에서 실패한 테스트 케이스의 수 
-        # print(p, q)
-        # d = total_test - np.sum(X[~is_failing, :][:, line_indices].any(axis=1)) # 자식 노드들에서 성공하지 않은 테스트 케이스의 수
-        # c = np.sum(X[~is_failing, :][:, [node_index] + line_indices].any(axis=1)) - np.sum(X[~is_failing, :][:, line_indices].any(axis=1))
-        # total_test - np.sum(X[is_failing, :][:, line_indices].any(axis=1)) - np.sum(~X[is_failing, :][:, node_index])
-        # 자식 노드들에서 성공하지 않고, 현재 노드에서 성공한 테스트 케이스의 수 
-        # print(p, q)
-        prob = 0
-        if b != 0:
-            prob = a / b
+    if batched:
+        probabilities = engine.failure_probabilities(pdg)
+        bayesian_network.add_nodes_from(
+            (node, {"failure_probability": prob}) for node, prob in probabilities.items()
+        )
+        bayesian_network.add_edges_from(pdg.edges)
+        return bayesian_network
 
+    for node in pdg.nodes:
+        # a: 자식 노드들에서 실패하지 않고, 현재 노드에서 실패한 테스트 케이스의 수
+        # b: 자식 노드들에서 실패하지 않은 테스트 케이스의 수, 고립된 노드는 전체 테스트 수
+        prob = engine.failure_probability(node, pdg.successors(node))
         bayesian_network.add_node(node, failure_probability=prob)
 
     for source, target in pdg.edges:
@@ -131,18 +104,17 @@ def save_bayesian_network(bn, output_file):
 
 # Paths
 filtered_pdg_folder = './sootDAG_filtered'
-spectrum_file = './method_level_spectrums.json'
+spectrum_dir = './method_level_spectrums'
 output_folder = './bayesian_networks'
-
-# Load method level spectrums
-with open(spectrum_file, 'r') as file:
-    spectrum_data = json.load(file)
+# 모든 노드의 확률을 희소 행렬 곱 한 번으로 계산
+BATCHED = True
 
 os.makedirs(output_folder, exist_ok=True)
 
 files_in_filtered_pdg = {f: f for f in os.listdir(filtered_pdg_folder)}
 
-for chart_key, methods in spectrum_data.items():
+# Only the bug ids are needed here, so the spectrum shards themselves are not read
+for chart_key in read_index(spectrum_dir):
     expected_file_name = f"{chart_key}_dependency_graph.dot"
     actual_file_name = files_in_filtered_pdg.get(expected_file_name)
     if not actual_file_name:
@@ -153,32 +125,13 @@ for chart_key, methods in spectrum_data.items():
 
     pdg = read_pdg(pdg_file)
     bug_info_path = os.path.join(f"./bug_data/{chart_key}.json") 
-    coverage_path = os.path.join(f"./bug_data/{chart_key}-cov.pkl")
     with open(bug_info_path, "r") as f:
         bug_info = json.load(f)
 
-    coverage = pd.read_pickle(coverage_path)
-    # print(coverage.dtypes) 
-
-    coverage.index = coverage.index.str.split(":").str[0]
-
-    coverage_bool = coverage.astype(bool)
-
-    unique_indices = coverage_bool.index.unique()
-
-    grouped_coverage = {}
-    for index in unique_indices:
-        subset = coverage_bool[coverage_bool.index == index]
-        result = subset.any(axis=0)
-        grouped_coverage[index] = result
-
-    grouped_coverage_df = pd.DataFrame.from_dict(grouped_coverage, orient="index")
-
-    grouped_coverage_df.index.name = "method"
-    grouped_coverage_df.columns.name = "tests"
+    method_coverage = load_method_coverage(chart_key)
 
     # Create Bayesian Network
-    bayesian_network = create_bayesian_network(pdg, grouped_coverage_df, bug_info["failing_tests"])
+    bayesian_network = create_bayesian_network(pdg, method_coverage, bug_info["failing_tests"], batched=BATCHED)
 
     # Save the Bayesian Network
     output_file = os.path.join(output_folder, f"{chart_key}_bayesian_network.dot")
@@ -0,0 +1,52 @@
+import numpy as np
+from ranking import buggy_rank_matrix
+
+# Largest (population x methods) score matrix computed at once, 2**24 float64 = 128 MB
+MAX_CELLS = 2 ** 24
+
+
+def bug_groups(corpus, bug_ids, max_methods):
+    """
+    Groups the bugs that are next to each other in the corpus so that each group has
+    at most max_methods methods (a larger bug is a group of its own).
+    :return: List of (first row, last row + 1, bug ids of the group).
+    """
+    wanted = set(bug_ids)
+    positions = [i for i, bug_id in enumerate(corpus.bug_ids) if bug_id in wanted]
+    groups = []
+    for i in positions:
+        start, stop = int(corpus.offsets[i]), int(corpus.offsets[i + 1])
+        if groups and groups[-1][1] == start and stop - groups[-1][0] <= max_methods:
+            groups[-1][1] = stop
+            groups[-1][2].append(corpus.bug_ids[i])
+        else:
+            groups.append([start, stop, [corpus.bug_ids[i]]])
+    return groups
+
+
+def population_ranks(functions, corpus, columns, bug_ids=None, ties="stable"):
+    """
+    Ranks of the buggy methods for a whole population at once. Each compiled formula
+    scores a group of bugs in one call, which gives a (population x methods) score
+    matrix, and the ranks of every individual on a bug come out of one vectorized
+    counting step (ranking.buggy_rank_matrix). The Python overhead is one call per
+    individual and group plus one per bug, instead of one per individual and bug.
+    :param functions: Vectorized formulas (see formula.compile_formula), one per individual.
+    :param columns: Dictionary of the formula variables over every method of the corpus.
+    :param bug_ids: Bugs to rank, defaults to every bug of the corpus.
+    :return: Dictionary bug_id -> (population x buggy methods) array of ranks, the same
+             values ranking.buggy_ranks gives for each individual.
+    """
+    bug_ids = corpus.bug_ids if bug_ids is None else bug_ids
+    max_methods = max(1, MAX_CELLS // max(1, len(functions)))
+
+    ranks = {}
+    for start, stop, group in bug_groups(corpus, bug_ids, max_methods):
+        group_columns = {name: column[start:stop] for name, column in columns.items()}
+        scores = np.stack([function(**group_columns) for function in functions])
+        for bug_id in group:
+            rows = corpus.bug_slice(bug_id)
+            ranks[bug_id] = buggy_rank_matrix(
+                scores[:, rows.start - start:rows.stop - start], corpus.buggy_indices(bug_id), ties
+            )
+    return ranks
@@ -0,0 +1,32 @@
+import os
+import gzip
+import pickle
+
+
+def save_checkpoint(path, state):
+    """
+    Writes the state of a run as a gzip compressed pickle. The file is written next
+    to the old one and renamed over it, so an interrupted save keeps the last checkpoint.
+    :param state: Picklable dictionary, e.g. generation, population and random states.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with gzip.open(path + ".tmp", "wb", compresslevel=6) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path):
+    """
+    :return: The saved state, or None when there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,79 @@
+import hashlib
+from collections import OrderedDict
+
+# Operators whose operands can be swapped without changing a single bit of the
+# result (IEEE addition and multiplication are commutative)
+COMMUTATIVE = {"+", "*", "add", "mul"}
+
+
+def canonical_form(op, operands):
+    """
+    Canonical string of an operator node from the canonical strings of its operands.
+    Operands of commutative operators are sorted, so (a + b) and (b + a) share one entry.
+    """
+    if op in COMMUTATIVE:
+        operands = sorted(operands)
+    return f"{op}({', '.join(operands)})"
+
+
+def training_set_id(bug_ids):
+    """
+    Short id of an ordered list of training bugs. The order is part of the id since
+    the fitness is a floating point sum over the bugs.
+    """
+    return hashlib.sha1("\n".join(bug_ids).encode()).hexdigest()
+
+
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness values keyed by (canonical form, training set id).
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """
+        :param key: Hashable key, e.g. (canonical form, training set id).
+        :param compute: Function without arguments returning the value on a miss.
+        """
+        found, value = self.lookup(key)
+        if not found:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def lookup(self, key):
+        """
+        :return: (found, value), counting a hit or a miss.
+        """
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return True, self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return f"{len(self)} entries, {self.hits} hits / {self.misses} misses (hit rate {self.hit_rate:.1%})"
@@ -0,0 +1,150 @@
+import copy
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+# Corpus of the island process, set once by _init_worker
+_CORPUS = None
+
+
+def _init_worker(corpus):
+    global _CORPUS
+    _CORPUS = corpus
+
+
+class IslandEngine:
+    """
+    The parts of a GP engine the island model needs. All three functions must be
+    module level functions of the engine so they can be sent to the island processes.
+    """
+    def __init__(self, random_population, next_generation, fitness, minimize):
+        """
+        :param random_population: random_population(size) -> list of individuals.
+        :param next_generation: next_generation(population, fitnesses) -> new population,
+                                one generation of the engine's selection and variation.
+        :param fitness: fitness(individual, *args, corpus) -> value.
+        :param minimize: True when a lower fitness is better.
+        """
+        self.random_population = random_population
+        self.next_generation = next_generation
+        self.fitness = fitness
+        self.minimize = minimize
+
+    def order(self, fitnesses):
+        """
+        :return: Positions from the best to the worst individual.
+        """
+        return sorted(range(len(fitnesses)), key=lambda i: fitnesses[i], reverse=not self.minimize)
+
+
+def _run_epoch(engine, population, fitnesses, size, generations, seed, args, corpus=None):
+    """
+    Evolves one island for a number of generations. A new island starts from
+    population=None. Fitness values that are passed in (e.g. of migrants) are reused.
+    :return: Final population and its fitness values.
+    """
+    corpus = _CORPUS if corpus is None else corpus
+    random.seed(seed)
+    if population is None:
+        population = engine.random_population(size)
+
+    for _ in range(generations):
+        if fitnesses is None:
+            fitnesses = [engine.fitness(individual, *args, corpus) for individual in population]
+        population = engine.next_generation(population, fitnesses)
+        fitnesses = None
+
+    fitnesses = [engine.fitness(individual, *args, corpus) for individual in population]
+    return population, fitnesses
+
+
+def migrate(engine, islands, migration_size):
+    """
+    Ring migration: copies of the best individuals of island i replace the worst
+    individuals of island i + 1.
+    :param islands: List of (population, fitnesses), changed in place.
+    """
+    migrants = []
+    for population, fitnesses in islands:
+        best = engine.order(fitnesses)[:migration_size]
+        migrants.append([(copy.deepcopy(population[i]), fitnesses[i]) for i in best])
+
+    for i, (population, fitnesses) in enumerate(islands):
+        worst = engine.order(fitnesses)[::-1]
+        for slot, (individual, fitness) in zip(worst, migrants[i - 1]):
+            population[slot] = individual
+            fitnesses[slot] = fitness
+
+
+def check_options(**options):
+    """
+    Island processes score their individuals one by one with the engine's fitness,
+    so engine options that change how a population is evaluated cannot be combined
+    with the island model.
+    :param options: Option name -> value, None, False or 0 when the option is off.
+    :raises ValueError: Some of the options are on.
+    """
+    enabled = [name for name, value in options.items() if value not in (None, False)]
+    if enabled:
+        raise ValueError(f"The island model does not support {', '.join(enabled)}")
+
+
+def run_islands(engine, corpus, args=(), num_islands=4, island_size=100, generations=50,
+                migration_interval=5, migration_size=2, seed=None, on_epoch=None, workers=None):
+    """
+    Island model: num_islands populations of island_size evolve in their own
+    processes with the engine's own operators. Every migration_interval generations
+    they exchange their best individuals. Each island gets the same number of
+    individuals as a normal run, so a generation takes as long as before as long
+    as there is a core per island.
+    :param args: Extra fitness arguments before the corpus, e.g. the training bug ids.
+    :param seed: Seed of the per-island, per-epoch seeds. Runs are reproducible for a given seed.
+    :param on_epoch: Called as on_epoch(generation, best individual, best fitness) after every epoch.
+    :param workers: Most island processes at once, defaults to one per island. With 1 the
+                    islands run one after the other in this process; results do not change.
+    :return: Best individual, its fitness and the final islands as (population, fitnesses) pairs.
+    """
+    seed_stream = random.Random(seed)
+    islands = [(None, None)] * num_islands
+    processes = num_islands if workers is None else min(num_islands, workers)
+    pool = None
+    if processes > 1:
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(corpus,))
+
+    try:
+        generation = 0
+        while generation < generations:
+            epoch = min(migration_interval, generations - generation)
+            tasks = [
+                (engine, population, fitnesses, island_size, epoch, seed_stream.getrandbits(64), args)
+                for population, fitnesses in islands
+            ]
+            if pool is None:
+                state = random.getstate()
+                try:
+                    islands = [_run_epoch(*task, corpus) for task in tasks]
+                finally:
+                    random.setstate(state)
+            else:
+                islands = list(pool.map(_run_epoch, *zip(*tasks)))
+            generation += epoch
+
+            best_individual, best_fitness = best_of(engine, islands)
+            if on_epoch is not None:
+                on_epoch(generation, best_individual, best_fitness)
+            if generation < generations:
+                migrate(engine, islands, migration_size)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    best_individual, best_fitness = best_of(engine, islands)
+    return best_individual, best_fitness, islands
+
+
+def best_of(engine, islands):
+    """
+    :return: Best (individual, fitness) over all islands.
+    """
+    candidates = [(population[i], fitnesses[i]) for population, fitnesses in islands for i in range(len(population))]
+    best = engine.order([fitness for _, fitness in candidates])[0]
+    return candidates[best]
@@ -1,10 +1,29 @@
 import os
-import json
+import sys
 import pandas as pd
 import numpy as np
 import random
 import copy
 import math
+import functools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from corpus import Corpus
+from formula import compile_formula
+from ranking import best_rank
+from fitness_cache import FitnessCache, canonical_form, training_set_id
+from parallel import ParallelEvaluator
+from islands import IslandEngine, check_options, run_islands
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from minibatch import MiniBatchEvaluator, corpus_subset
+from batched import population_ranks
+from simplify import simplify, format_constant
+from semantic import SemanticHasher, probe_corpus
+
+TIES = "stable"  # 동점 처리 방식, ranking.TIE_POLICIES 참고
+
+# (정규화된 식, 학습 버그 집합) -> 적합도
+FITNESS_CACHE = FitnessCache(maxsize=100000)
 
 class Node:
     def __init__(self, value, left=None, right=None):
@@ -12,14 +31,6 @@ class Node:
         self.left = left
         self.right = right
 
-def safe_div(x, y):
-    x = np.array(x, dtype=float)
-    y = np.array(y, dtype=float)
-    out = np.ones_like(x, dtype=float)
-    mask = (y != 0)
-    out[mask] = x[mask] / y[mask]
-    return out
-
 def generate_random_tree(depth):
     # p 제거, ep, ef, np, nf와 상수만 사용
     if depth == 0 or (depth > 0 and random.random() < 0.4):
@@ -42,38 +53,53 @@ def random_node(node):
     traverse(node)
     return random.choice(nodes)
 
+TERMINAL_COLUMNS = {"ep": "e_p", "ef": "e_f", "np": "n_p", "nf": "n_f"}
+
+def tree_to_expression(node):
+    """Formula tree as an expression for formula.compile_formula, x / 0 evaluates to 1."""
+    if node.left is None and node.right is None:
+        return TERMINAL_COLUMNS.get(node.value, node.value)
+    left = tree_to_expression(node.left)
+    right = tree_to_expression(node.right)
+    if node.value == "/":
+        return f"safe_divide({left}, {right}, 1.0)"
+    return f"({left} {node.value} {right})"
+
 def evaluate_formula(tree, ep, ef, np_, nf):
-    """Evaluate formula tree vectorized over methods, without p."""
-    ep = np.array(ep, dtype=float)
-    ef = np.array(ef, dtype=float)
-    np_ = np.array(np_, dtype=float)
-    nf = np.array(nf, dtype=float)
-
-    def eval_node(node, ep, ef, np_, nf):
-        if node.left is None and node.right is None:
-            if node.value == "ep":
-                return ep
-            elif node.value == "ef":
-                return ef
-            elif node.value == "np":
-                return np_
-            elif node.value == "nf":
-                return nf
-            else:
-                return float(node.value)*np.ones_like(ep)
-        else:
-            left = eval_node(node.left, ep, ef, np_, nf)
-            right = eval_node(node.right, ep, ef, np_, nf)
-            if node.value == "+":
-                return left + right
-            elif node.value == "-":
-                return left - right
-            elif node.value == "*":
-                return left * right
-            elif node.value == "/":
-                return safe_div(left, right)
-
-    return eval_node(tree, ep, ef, np_, nf)
+    """Evaluate formula tree vectorized over methods, without p. The tree is compiled once per formula."""
+    return compile_formula(tree_to_expression(tree))(e_p=ep, e_f=ef, n_p=np_, n_f=nf)
+
+TERMS = {"+": "add", "-": "sub", "*": "mul", "/": "div"}
+OPERATORS = {term: op for op, term in TERMS.items()}
+
+def tree_to_term(node):
+    """Formula tree as a GP/simplify.py term."""
+    if node.left is None and node.right is None:
+        if node.value in TERMINAL_COLUMNS:
+            return ("var", node.value)
+        return ("const", float(node.value))
+    return (TERMS[node.value], tree_to_term(node.left), tree_to_term(node.right))
+
+def term_to_tree(term):
+    if term[0] == "var":
+        return Node(term[1])
+    if term[0] == "const":
+        return Node(format_constant(term[1]))
+    return Node(OPERATORS[term[0]], term_to_tree(term[1]), term_to_tree(term[2]))
+
+def simplify_tree(node):
+    """Smaller formula tree with the same fitness."""
+    return term_to_tree(simplify(tree_to_term(node)))
+
+def canonical_key(node):
+    """Formula with the operands of + and * in a fixed order, used as the fitness cache key."""
+    if node.left is None and node.right is None:
+        return node.value
+    return canonical_form(node.value, [canonical_key(node.left), canonical_key(node.right)])
+
+def score_corpus(tree, corpus):
+    """Evaluate formula tree on every method of every bug at once, split per bug."""
+    return corpus.split(evaluate_formula(tree, corpus.e_p, corpus.e_f, corpus.n_p, corpus.n_f))
 
 def mutate(node, mutation_rate=0.1):
     if random.random() < mutation_rate:
@@ -111,95 +137,199 @@ def tree_to_formula(node):
         right_str = tree_to_formula(node.right)
         return f'({left_str} {node.value} {right_str})'
 
-def load_bug_info(bug_id, data_dir="./bug_data"):
-    bug_info_path = os.path.join(data_dir, f"{bug_id}.json")
-    with open(bug_info_path, "r") as f:
-        bug_info = json.load(f)
-    return bug_info
-
-def run_gp(training_data, generations=200, population_size=50, elitism_rate=0.2):
-    population = [generate_random_tree(depth=4) for _ in range(population_size)]
-    best_individual = None
-    best_fitness_ever = math.inf
-
-    for generation in range(generations):
-        fitness_scores = []
-        for individual in population:
-            total_fitness = 0
-            for data in training_data:
-                try:
-                    scores = evaluate_formula(
-                        individual,
-                        data['e_p'],
-                        data['e_f'],
-                        data['n_p'],
-                        data['n_f']
-                    )
-
-                    methods = data['methods']
-                    sbfl_scores = list(zip(methods, scores))
-                    sbfl_scores.sort(key=lambda x: x[1], reverse=True)
-
-                    ranks = {m: i+1 for i, (m, _) in enumerate(sbfl_scores)}
-                    buggy_ranks = [ranks[m] for m in data['buggy_methods'] if m in ranks]
-
-                    if buggy_ranks:
-                        fitness = min(buggy_ranks)
-                    else:
-                        fitness = len(methods) + 1
-                    total_fitness += fitness
-                except Exception:
-                    total_fitness += len(data['methods']) + 1
-
-            avg_fitness = total_fitness / len(training_data)
-            fitness_scores.append(avg_fitness)
-
-        best_fitness = min(fitness_scores)
-        if best_fitness < best_fitness_ever:
-            best_fitness_ever = best_fitness
-            best_index = fitness_scores.index(best_fitness)
-            best_individual = copy.deepcopy(population[best_index])
-
-        # print(f"Generation {generation + 1}/{generations}: Best Fitness: {best_fitness}, Best Ever: {best_fitness_ever}")
-
-        # Elitism
-        elite_size = int(population_size * elitism_rate)
-        sorted_pop = [p for p, f in sorted(zip(population, fitness_scores), key=lambda x: x[1])]
-        new_population = sorted_pop[:elite_size]
-
-        while len(new_population) < population_size:
-            parent1 = tournament_selection(population, fitness_scores)
-            parent2 = tournament_selection(population, fitness_scores)
-            child = crossover(parent1, parent2)
-            child = mutate(child, mutation_rate=0.1)
-            new_population.append(child)
-
-        population = new_population
+def compute_fitness(individual, corpus):
+    """Average best rank of the buggy methods over the corpus (lower is better)."""
+    total_fitness = 0
+    try:
+        scores = score_corpus(individual, corpus)
+    except Exception:
+        scores = None
+
+    for bug_id in corpus.bug_ids:
+        buggy_indices = corpus.buggy_indices(bug_id)
+        if scores is not None and len(buggy_indices):
+            fitness = best_rank(scores[bug_id], buggy_indices, TIES)
+        else:
+            fitness = corpus.num_methods(bug_id) + 1
+        total_fitness += fitness
+
+    return total_fitness / len(corpus)
 
+def compute_population_fitness(individuals, corpus):
+    """compute_fitness of a whole population at once, see GP/batched.py."""
+    functions = [compile_formula(tree_to_expression(individual)) for individual in individuals]
+    ranks = population_ranks(functions, corpus, corpus.columns(), ties=TIES)
+
+    total_fitness = np.zeros(len(individuals), dtype=np.float64 if TIES == "average" else np.int64)
+    for bug_id in corpus.bug_ids:
+        if ranks[bug_id].shape[1]:
+            total_fitness += ranks[bug_id].min(axis=1)
+        else:
+            total_fitness += corpus.num_methods(bug_id) + 1
+
+    return (total_fitness / len(corpus)).tolist()
+
+def batch_fitness(individual, bug_ids, corpus):
+    # mini-batch 적합도, 주어진 버그들만으로 만든 corpus에서 계산
+    return compute_fitness(individual, corpus_subset(corpus, bug_ids))
+
+def batch_population_fitness(individuals, bug_ids, corpus):
+    return compute_population_fitness(individuals, corpus_subset(corpus, bug_ids))
+
+def batch_fitness_key(individual, bug_ids):
+    return (canonical_key(individual), training_set_id(bug_ids))
+
+def cached_fitness(individual, corpus):
+    key = (canonical_key(individual), training_set_id(corpus.bug_ids))
+    return FITNESS_CACHE.get(key, lambda: compute_fitness(individual, corpus))
+
+def random_population(size):
+    return [generate_random_tree(depth=4) for _ in range(size)]
+
+def next_generation(population, fitness_scores, elitism_rate=0.2, simplify_offspring=False):
+    # Elitism
+    elite_size = int(len(population) * elitism_rate)
+    sorted_pop = [p for p, f in sorted(zip(population, fitness_scores), key=lambda x: x[1])]
+    new_population = sorted_pop[:elite_size]
+
+    while len(new_population) < len(population):
+        parent1 = tournament_selection(population, fitness_scores)
+        parent2 = tournament_selection(population, fitness_scores)
+        child = crossover(parent1, parent2)
+        child = mutate(child, mutation_rate=0.1)
+        if simplify_offspring:
+            child = simplify_tree(child)
+        new_population.append(child)
+
+    return new_population
+
+def run_gp(corpus, generations=200, population_size=50, elitism_rate=0.2, workers=None, seed=None,
+           islands=1, migration_interval=5, migration_size=2,
+           checkpoint=None, checkpoint_interval=10, resume=False, batch_fraction=None, batched=False,
+           simplify_offspring=False, semantic_probes=None, semantic_diversity=False):
+    """
+    With islands > 1 runs the island model: `islands` populations of population_size
+    evolve in their own processes and exchange their best individuals every
+    migration_interval generations (see GP/islands.py). workers then caps the number
+    of island processes. Checkpoints, batch_fraction, batched and semantic_probes are
+    not supported with islands and raise a ValueError.
+
+    With a checkpoint path the population, random states and best-so-far are saved
+    every checkpoint_interval generations, and resume=True continues from the saved
+    generation. The checkpoint is removed when the run finishes.
+
+    With a batch_fraction every generation is scored on that fraction of the bugs
+    and only the elites are re-scored on all bugs (see GP/minibatch.py).
+
+    With batched=True each worker scores its share of the population as one
+    (population x methods) matrix per group of bugs (see GP/batched.py).
+
+    With simplify_offspring=True every child is replaced by a smaller formula with
+    the same fitness (see GP/simplify.py).
+
+    With semantic_probes=n the fitness cache is keyed by the order the formula puts
+    the methods of n fixed probe bugs in, so formulas that rank them the same way are
+    scored once. semantic_diversity=True also replaces children that behave like an
+    earlier individual by new random trees (see GP/semantic.py).
+    """
+    if islands > 1:
+        check_options(checkpoint=checkpoint, batch_fraction=batch_fraction, batched=batched,
+                      semantic_probes=semantic_probes, semantic_diversity=semantic_diversity)
+        engine = IslandEngine(
+            random_population,
+            functools.partial(next_generation, elitism_rate=elitism_rate, simplify_offspring=simplify_offspring),
+            cached_fitness, minimize=True,
+        )
+        best_individual, _, _ = run_islands(
+            engine, corpus, (), islands, population_size, generations, migration_interval, migration_size, seed,
+            workers=workers,
+        )
+        # 적합도는 island 프로세스의 캐시에서 계산되므로 여기 FITNESS_CACHE 통계는 출력하지 않음
+        return best_individual
+
+    state = load_checkpoint(checkpoint) if checkpoint and resume else None
+    if state is not None:
+        # 저장된 세대부터 이어서 진행
+        population = state["population"]
+        best_individual = state["best_individual"]
+        best_fitness_ever = state["best_fitness_ever"]
+        start = state["generation"]
+    else:
+        population = random_population(population_size)
+        best_individual = None
+        best_fitness_ever = math.inf
+        start = 0
+    corpus_id = training_set_id(corpus.bug_ids)
+
+    # 개체들의 적합도를 프로세스 풀에서 병렬로 계산 (캐시에 있는 식은 제외)
+    if batch_fraction is None:
+        fitness = compute_population_fitness if batched else compute_fitness
+        key = lambda individual: (canonical_key(individual), corpus_id)
+    else:
+        fitness, key = (batch_population_fitness if batched else batch_fitness), batch_fitness_key
+    if semantic_probes:
+        hasher = SemanticHasher(
+            lambda tree: compile_formula(tree_to_expression(tree)), probe_corpus(corpus, semantic_probes).columns(),
+            canonical_key,
+        )
+        if batch_fraction is None:
+            key = lambda individual: (hasher.fingerprint(individual), corpus_id)
+        else:
+            key = lambda individual, bug_ids: (hasher.fingerprint(individual), training_set_id(bug_ids))
+    with ParallelEvaluator(fitness, corpus, workers, seed, FITNESS_CACHE, key, batched) as evaluator:
+        if batch_fraction is not None:
+            elite_size = max(1, int(population_size * elitism_rate))
+            batches = MiniBatchEvaluator(evaluator, corpus.bug_ids, batch_fraction, elite_size, minimize=True,
+                                         seed=random.getrandbits(64))
+        if state is not None:
+            random.setstate(state["random_state"])
+            evaluator.rng.setstate(state["evaluator_state"])
+            if batch_fraction is not None:
+                batches.rng.setstate(state["batch_state"])
+        for generation in range(start, generations):
+            if batch_fraction is not None:
+                fitness_scores = batches.evaluate(population)
+            else:
+                fitness_scores = evaluator.evaluate(population)
+
+            best_fitness = min(fitness_scores)
+            if best_fitness < best_fitness_ever:
+                best_fitness_ever = best_fitness
+                best_index = fitness_scores.index(best_fitness)
+                best_individual = copy.deepcopy(population[best_index])
+
+            # print(f"Generation {generation + 1}/{generations}: Best Fitness: {best_fitness}, Best Ever: {best_fitness_ever}")
+
+            population = next_generation(population, fitness_scores, elitism_rate, simplify_offspring)
+            if semantic_probes and semantic_diversity:
+                population = hasher.replace_duplicates(
+                    population, lambda: generate_random_tree(depth=4), start=int(population_size * elitism_rate)
+                )
+
+            if checkpoint and (generation + 1) % checkpoint_interval == 0:
+                save_checkpoint(checkpoint, {
+                    "generation": generation + 1, "population": population,
+                    "best_individual": best_individual, "best_fitness_ever": best_fitness_ever,
+                    "random_state": random.getstate(), "evaluator_state": evaluator.rng.getstate(),
+                    "batch_state": batches.rng.getstate() if batch_fraction is not None else None,
+                })
+
+    if checkpoint:
+        remove_checkpoint(checkpoint)
+    print(f"Fitness cache: {FITNESS_CACHE}")
     return best_individual
 
-def evaluate_on_all_bugs(best_formula_tree, training_data):
+def evaluate_on_all_bugs(best_formula_tree, corpus):
     total_acc1 = 0
     total_wef = 0
     project_results = {}
 
-    for data in training_data:
-        methods = data['methods']
-        e_p = data['e_p']
-        e_f = data['e_f']
-        n_p = data['n_p']
-        n_f = data['n_f']
-        buggy_methods = data['buggy_methods']
-        bug_id = data['bug_id']
-
-        scores = evaluate_formula(best_formula_tree, e_p, e_f, n_p, n_f)
-        sbfl_scores = list(zip(methods, scores))
-        sbfl_scores.sort(key=lambda x: x[1], reverse=True)
-        ranks = {m: i+1 for i, (m, _) in enumerate(sbfl_scores)}
-        buggy_ranks = [ranks[m] for m in buggy_methods if m in ranks]
-
-        if buggy_ranks:
-            rank = min(buggy_ranks)
+    scores = score_corpus(best_formula_tree, corpus)
+    for bug_id in corpus.bug_ids:
+        buggy_indices = corpus.buggy_indices(bug_id)
+
+        if len(buggy_indices):
+            rank = best_rank(scores[bug_id], buggy_indices, TIES)
             total_wef += rank
             acc1 = 1 if rank == 1 else 0
             total_acc1 += acc1
@@ -211,7 +341,7 @@ def evaluate_on_all_bugs(best_formula_tree, training_data):
             project_results[project_name]['wef'] += rank
             project_results[project_name]['bugs'] += 1
         else:
-            total_wef += len(methods)
+            total_wef += corpus.num_methods(bug_id)
 
     return total_acc1, total_wef, project_results
 
@@ -225,43 +355,18 @@ def report_results(best_formula_str, overall_acc1, overall_wef, project_results)
 
 if __name__ == "__main__":
     # new_spectrum.json 로드 (여기서는 p값도 읽지만 사용은 안함)
-    with open("new_spectrum.json", "r") as f:
-        method_level_spectrum = json.load(f)
-
-    data_dir = "./bug_data"
-    bug_ids = list(method_level_spectrum.keys())
-
-    training_data = []
-    for bug_id in bug_ids:
-        bug_info = load_bug_info(bug_id, data_dir=data_dir)
-        spectrum = method_level_spectrum[bug_id]
-        methods = list(spectrum.keys())
-
-        e_p = [spectrum[m]['e_p'] for m in methods]
-        n_p = [spectrum[m]['n_p'] for m in methods]
-        e_f = [spectrum[m]['e_f'] for m in methods]
-        n_f = [spectrum[m]['n_f'] for m in methods]
-        # p 값을 읽더라도 사용하지 않음
-        # p = [spectrum[m]['p'] for m in methods]
-
-        buggy_methods = [bl.split(':')[0] for bl in bug_info['buggy_lines']]
-
-        training_data.append({
-            'bug_id': bug_id,
-            'methods': methods,
-            'e_p': e_p,
-            'n_p': n_p,
-            'e_f': e_f,
-            'n_f': n_f,
-            'buggy_methods': buggy_methods
-        })
+    corpus = Corpus.load("new_spectrum.json", data_dir="./bug_data")
 
     # GP 실행 (p 없이)
-    best_formula_tree = run_gp(training_data, generations=100, population_size=40)
+    # 10세대마다 checkpoint 저장, 중단되면 --resume 으로 이어서 실행
+    best_formula_tree = run_gp(
+        corpus, generations=100, population_size=40,
+        checkpoint="jihun_gp_without_p_checkpoint.pkl.gz", resume="--resume" in sys.argv,
+    )
 
     best_formula_str = tree_to_formula(best_formula_tree)
     print(f"Best Evolved Formula: {best_formula_str}")
 
     # 모든 버그에 대한 평가
-    overall_acc1, overall_wef, project_results = evaluate_on_all_bugs(best_formula_tree, training_data)
+    overall_acc1, overall_wef, project_results = evaluate_on_all_bugs(best_formula_tree, corpus)
     report_results(best_formula_str, overall_acc1, overall_wef, project_results)
\ No newline at end of file
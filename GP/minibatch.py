@@ -0,0 +1,78 @@
+import random
+from collections import OrderedDict
+from fitness_cache import training_set_id
+
+# Subsets of the corpus of this process, built once per mini-batch
+_SUBSETS = OrderedDict()
+_MAX_SUBSETS = 4
+
+
+def corpus_subset(corpus, bug_ids):
+    """
+    Corpus.subset with a small per-process memo, so a worker builds the subset of a
+    mini-batch once and not once per individual. The whole corpus is returned as is.
+    """
+    bug_ids = list(bug_ids)
+    if bug_ids == corpus.bug_ids:
+        return corpus
+
+    key = (id(corpus), training_set_id(bug_ids))
+    if key not in _SUBSETS:
+        _SUBSETS[key] = corpus.subset(bug_ids)
+        if len(_SUBSETS) > _MAX_SUBSETS:
+            _SUBSETS.popitem(last=False)
+    return _SUBSETS[key]
+
+
+class MiniBatchEvaluator:
+    """
+    Scores a population on a mini-batch of the training bugs and re-scores only the
+    best candidates on the whole training set.
+
+    Every call draws one mini-batch that all individuals of the generation share, so
+    their fitness values are comparable. The best `top` positions are then re-scored
+    on all training bugs, and again until the best `top` values are all full-set
+    values, so the elites are always chosen on the real fitness. The rest keep their
+    mini-batch fitness for tournament selection. A generation costs about
+    batch_fraction of a full evaluation plus `top` full evaluations.
+
+        with ParallelEvaluator(fitness, corpus, ...) as evaluator:
+            batches = MiniBatchEvaluator(evaluator, training_bugs, 0.2, top=8, minimize=True)
+            fitnesses = batches.evaluate(population)
+    """
+    def __init__(self, evaluator, bug_ids, batch_fraction, top, minimize, seed=None):
+        """
+        :param evaluator: ParallelEvaluator of a fitness(individual, bug_ids, corpus).
+        :param bug_ids: All training bugs.
+        :param batch_fraction: Fraction of the training bugs in a mini-batch.
+        :param top: Number of best individuals that get a full-set fitness.
+        :param minimize: True when a lower fitness is better.
+        """
+        self.evaluator = evaluator
+        self.bug_ids = list(bug_ids)
+        self.batch_size = max(1, min(len(self.bug_ids), round(len(self.bug_ids) * batch_fraction)))
+        self.top = top
+        self.minimize = minimize
+        self.rng = random.Random(seed)
+
+    def batch(self):
+        """
+        :return: Next mini-batch, in the order of the training bugs.
+        """
+        return [self.bug_ids[i] for i in sorted(self.rng.sample(range(len(self.bug_ids)), self.batch_size))]
+
+    def evaluate(self, population):
+        """
+        :return: List of fitness values in population order.
+        """
+        fitnesses = self.evaluator.evaluate(population, self.batch())
+        full = set()
+        while True:
+            best = sorted(range(len(fitnesses)), key=lambda i: fitnesses[i], reverse=not self.minimize)[:self.top]
+            pending = [i for i in best if i not in full]
+            if not pending:
+                return fitnesses
+            values = self.evaluator.evaluate([population[i] for i in pending], self.bug_ids)
+            for i, value in zip(pending, values):
+                fitnesses[i] = value
+                full.add(i)
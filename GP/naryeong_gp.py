@@ -1,13 +1,42 @@
 import os
-import json
+import sys
 import random
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from corpus import Corpus
+from formula import compile_formula
+from ranking import best_rank
+from fitness_cache import FitnessCache, canonical_form, training_set_id
+from parallel import ParallelEvaluator
+from islands import IslandEngine, check_options, run_islands
+from minibatch import MiniBatchEvaluator, corpus_subset
+from batched import population_ranks
+from simplify import simplify, format_constant
+from semantic import SemanticHasher, probe_corpus
+
 
 NUM_POPULATIONS = 40
 NUM_GENERATIONS = 100
 NUM_ELITES = 8
 NUM_SAMPLE_BUGS = 50
+TIES = "stable"  # 동점 처리 방식, ranking.TIE_POLICIES 참고
+FITNESS_CACHE_SIZE = 100000
+WORKERS = os.cpu_count()  # 버그별 ranking 계산 프로세스 수, 1이면 병렬 처리 안함
+NUM_ISLANDS = 1  # 2 이상이면 island 모델, 섬마다 NUM_POPULATIONS 개체를 별도 프로세스(최대 WORKERS 개)에서 진화
+# island 모델은 MINI_BATCH, BATCHED, SEMANTIC_PROBES 와 함께 쓸 수 없음 (ValueError)
+MIGRATION_INTERVAL = 5  # 몇 세대마다 섬 사이에 개체를 교환할지
+MIGRATION_SIZE = 2  # 교환할 때 옆 섬으로 보내는 최상위 개체 수
+# 버그 샘플링 대신 세대마다 고정된 mini-batch(전체 버그 중 MINI_BATCH 비율)로 모든 개체를 평가하고
+# 상위 NUM_ELITES 개체는 전체 버그로 다시 평가. None이면 개체마다 NUM_SAMPLE_BUGS 개 버그를 샘플링
+MINI_BATCH = None
+# True면 집단 전체를 (개체 x 메소드) 점수 행렬로 한 번에 계산 (GP/batched.py)
+BATCHED = False
+# True면 교차/변이로 만든 개체를 적합도가 같은 더 작은 식으로 정리 (GP/simplify.py)
+SIMPLIFY = False
+# 적합도 캐시를 식 대신 SEMANTIC_PROBES 개 probe 버그에서의 메소드 순위로 찾음, None이면 사용 안함 (GP/semantic.py)
+SEMANTIC_PROBES = None
+SEMANTIC_DIVERSITY = False  # True면 이미 있는 개체와 순위가 같은 자식을 새 랜덤 개체로 교체
 
 # NUM_POPULATIONS = 5
 # NUM_GENERATIONS = 1
@@ -15,8 +44,8 @@ NUM_SAMPLE_BUGS = 50
 # NUM_SAMPLE_BUGS = 5
 spectrum_with_p_file = '../new_spectrum.json'
 
-with open(spectrum_with_p_file, 'r') as f:
-    method_level_spectrum = json.load(f)
+# (정규화된 식, 버그 집합) -> 버그별 ranking, mini-batch 모드에서는 평균 expense
+FITNESS_CACHE = FitnessCache(FITNESS_CACHE_SIZE)
 
 
 class Node:
@@ -28,8 +57,8 @@ class Node:
     def set_parent(self, node):
         self.parent = node
 
-    def evaluate(self, spectra): # comment?
-        self.fitness = compute_fitness(self)
+    def evaluate(self, corpus): # comment?
+        self.fitness = compute_fitness(self, corpus)
 
 class Variable(Node):
     def __init__(self, name):
@@ -38,6 +67,9 @@ class Variable(Node):
     def __str__(self):
         return self.name
 
+    def canonical_key(self):
+        return self.name
+
     def copy(self):
         return Variable(self.name)
 
@@ -61,6 +93,10 @@ class BinaryOp(Node):
     def __str__(self):
         return f"({str(self.left)} {self.name} {str(self.right)})"
 
+    def canonical_key(self):
+        # +, * 의 피연산자 순서를 정규화 (적합도 캐시 키)
+        return canonical_form(self.name, [self.left.canonical_key(), self.right.canonical_key()])
+
     def get_cut_points(self):
         return [self] + self.left.get_cut_points() + self.right.get_cut_points()
 
@@ -91,6 +127,33 @@ class DivOp(BinaryOp):
         return f"(1 if {self.right} == 0 else {self.left}/{self.right})"
 
 
+TERMS = {"+": "add", "-": "sub", "*": "mul", "/": "div"}
+OPERATORS = {term: op for op, term in TERMS.items()}
+
+def to_term(node):
+    # simplify.py 의 term 으로 변환
+    if isinstance(node, Variable):
+        try:
+            return ("const", float(node.name))
+        except ValueError:
+            return ("var", node.name)
+    return (TERMS[node.name], to_term(node.left), to_term(node.right))
+
+def from_term(term):
+    if term[0] == "var":
+        return Variable(term[1])
+    if term[0] == "const":
+        return Variable(format_constant(term[1]))
+    node = get_nonterminal(OPERATORS[term[0]])
+    node.set_left(from_term(term[1]))
+    node.set_right(from_term(term[2]))
+    return node
+
+def simplify_individual(individual):
+    # 적합도가 같은 더 작은 식
+    return from_term(simplify(to_term(individual)))
+
+
 # Utility functions for creating nodes
 def get_nonterminal(op_name=None):
     if op_name:
@@ -221,34 +284,54 @@ def mutate(node, p=0.5):
                     cut.parent.right = new_node
     return cnode
 
-def compute_fitness(individual):
+def score_corpus(formula, corpus):
+    # 모든 버그의 모든 메소드를 한 번에 계산하여 버그별로 나눔
+    return corpus.split(compile_formula(str(formula))(**corpus.columns()))
+
+def rank_corpus(formula, corpus):
+    sbfl_scores = score_corpus(formula, corpus)
+    return {bug: best_rank(sbfl_scores[bug], corpus.buggy_indices(bug), TIES) for bug in corpus.bug_ids}
+
+def rank_population(individuals, corpus):
+    # rank_corpus 를 집단 전체에 대해 한 번에 계산
+    functions = [compile_formula(str(individual)) for individual in individuals]
+    ranks = population_ranks(functions, corpus, corpus.columns(), ties=TIES)
+    best = {bug: ranks[bug].min(axis=1).tolist() for bug in corpus.bug_ids}
+    return [{bug: best[bug][i] for bug in corpus.bug_ids} for i in range(len(individuals))]
+
+def ranking_key(individual, corpus):
+    return (individual.canonical_key(), training_set_id(corpus.bug_ids))
+
+def compute_fitness(individual, corpus):
     # if individual == None:
     #     print("None....")
-    expenses = []
-    all_bugs = [file.split('_')[0] for file in os.listdir('../sootDAG_filtered')]
-    sample_bugs = random.choices(all_bugs, k=NUM_SAMPLE_BUGS)
+    # 같은 식은 버그별 ranking을 다시 계산하지 않음, 샘플링은 매번 새로
+    rankings = FITNESS_CACHE.get(ranking_key(individual, corpus), lambda: rank_corpus(individual, corpus))
+    return sampled_fitness(rankings, corpus)
 
-    for bug in sample_bugs:
-        spectrum = method_level_spectrum[bug]
+def sampled_fitness(rankings, corpus):
+    sample_bugs = random.choices(corpus.bug_ids, k=NUM_SAMPLE_BUGS)
+    return mean_expense(rankings, sample_bugs, corpus)
 
-        with open(f"../bug_data/{bug}.json", 'r') as f:
-            bug_info = json.load(f)
-        
-        sbfl_scores = {}
-        buggy_methods = [buggy_lines.split(':')[0] for buggy_lines in bug_info["buggy_lines"]]
-        for method, spectra in spectrum.items():
-            sbfl_scores[method] = eval(str(individual), {}, spectra)
-
-                
-        # print(sbfl_scores)
-        sorted_sbfl_scores = sorted(sbfl_scores.items(), key=lambda x: x[1], reverse=True)
-        ranks = {method: rank+1 for rank, (method, _) in enumerate(sorted_sbfl_scores)}
-        # print(ranks)
-        # print(buggy_methods)
-        buggy_methods_ranks = [ranks[buggy_method] for buggy_method in buggy_methods]
-        ranking = min(buggy_methods_ranks)
+def batch_fitness(individual, bug_ids, corpus):
+    # mini-batch 적합도: 샘플링 없이 주어진 버그 전체의 평균 expense
+    subset = corpus_subset(corpus, bug_ids)
+    return mean_expense(rank_corpus(individual, subset), subset.bug_ids, subset)
+
+def batch_population_fitness(individuals, bug_ids, corpus):
+    subset = corpus_subset(corpus, bug_ids)
+    return [mean_expense(rankings, subset.bug_ids, subset) for rankings in rank_population(individuals, subset)]
+
+def batch_fitness_key(individual, bug_ids):
+    return ("mean_expense", individual.canonical_key(), training_set_id(bug_ids))
+
+def mean_expense(rankings, bugs, corpus):
+    expenses = []
+
+    for bug in bugs:
+        ranking = rankings[bug]
         penalty = 10 if ranking != 1 else 0
-        expense = (ranking/len(spectrum))*10 + penalty
+        expense = (ranking/corpus.num_methods(bug))*10 + penalty
         expenses.append(expense)
     
     fitness_score = sum(expenses)/len(expenses)
@@ -257,63 +340,106 @@ def compute_fitness(individual):
 
         
 
-def genetic_programming():
+def random_population(size):
     populations = []
-    for _ in range(NUM_POPULATIONS//2):
+    for _ in range(size//2):
         max_height = random.randint(2, 4)
         populations.append(full_tree(max_height))
         populations.append(grow_tree(max_height))
     #     print(max_height)
     # for ind in populations:
     #     print(str(ind))
-
-    for _ in tqdm(range(NUM_GENERATIONS)):
-        fitness_scores = [(individual, compute_fitness(individual)) for individual in populations]
-        sorted_fitness_scores = sorted(fitness_scores, key=lambda x: x[1])  # Minimize
-        elites = [i for i, _ in sorted_fitness_scores[:NUM_ELITES]]
-        new_populations = elites[:]
-
-        # for indiv, score in sorted_fitness_scores:
-        #         print(str(indiv), score)
-        # print('------------------------------')
-        # for indiv in elites:
-        #     print(str(indiv))
-
-        while len(new_populations) < (NUM_POPULATIONS):
-            if random.random() < 0.5:
-                mutated = mutate(random.choice(elites))
-                new_populations.append(mutated)
+    return populations
+
+def next_generation(populations, fitness_scores):
+    sorted_fitness_scores = sorted(zip(populations, fitness_scores), key=lambda x: x[1])  # Minimize
+    elites = [i for i, _ in sorted_fitness_scores[:NUM_ELITES]]
+    new_populations = elites[:]
+
+    # for indiv, score in sorted_fitness_scores:
+    #         print(str(indiv), score)
+    # print('------------------------------')
+    # for indiv in elites:
+    #     print(str(indiv))
+
+    while len(new_populations) < len(populations):
+        if random.random() < 0.5:
+            mutated = mutate(random.choice(elites))
+            new_populations.append(mutated)
+        else:
+            child1, child2 = crossover(random.choices(elites, k = 2))
+            new_populations.append(child1)
+            if len(new_populations) < (len(populations)-NUM_ELITES):
+                new_populations.append(child2)
+
+    if SIMPLIFY:
+        new_populations[NUM_ELITES:] = [simplify_individual(child) for child in new_populations[NUM_ELITES:]]
+
+    assert len(new_populations) == len(populations)
+    return new_populations
+
+ISLAND_ENGINE = IslandEngine(random_population, next_generation, compute_fitness, minimize=True)
+
+def genetic_programming_islands(corpus):
+    # 섬마다 별도 프로세스, MIGRATION_INTERVAL 세대마다 최상위 개체를 옆 섬으로 보냄
+    check_options(MINI_BATCH=MINI_BATCH, BATCHED=BATCHED, SEMANTIC_PROBES=SEMANTIC_PROBES,
+                  SEMANTIC_DIVERSITY=SEMANTIC_DIVERSITY)
+    _, _, islands = run_islands(
+        ISLAND_ENGINE, corpus, (), NUM_ISLANDS, NUM_POPULATIONS, NUM_GENERATIONS,
+        MIGRATION_INTERVAL, MIGRATION_SIZE, seed=random.getrandbits(64),
+        on_epoch=lambda generation, _, fitness: print(f"Generation {generation}: best fitness {fitness}"),
+        workers=WORKERS,
+    )
+    fitness_scores = [(individual, fitness) for population, fitnesses in islands for individual, fitness in zip(population, fitnesses)]
+    return sorted(fitness_scores, key=lambda x: x[1])
+
+def genetic_programming(corpus):
+    if NUM_ISLANDS > 1:
+        return genetic_programming_islands(corpus)
+
+    populations = random_population(NUM_POPULATIONS)
+
+    # 버그별 ranking 계산(무거운 부분)은 프로세스 풀에서, 버그 샘플링은 지금처럼 이 프로세스에서 순서대로
+    if MINI_BATCH is None:
+        fitness, key = (rank_population if BATCHED else rank_corpus), lambda individual: ranking_key(individual, corpus)
+    else:
+        fitness, key = (batch_population_fitness if BATCHED else batch_fitness), batch_fitness_key
+    if SEMANTIC_PROBES:
+        # 순위가 같은 식은 한 번만 계산
+        hasher = SemanticHasher(
+            lambda individual: compile_formula(str(individual)), probe_corpus(corpus, SEMANTIC_PROBES).columns(),
+            lambda individual: individual.canonical_key(),
+        )
+        if MINI_BATCH is None:
+            key = lambda individual: (hasher.fingerprint(individual), training_set_id(corpus.bug_ids))
+        else:
+            key = lambda individual, bug_ids: ("mean_expense", hasher.fingerprint(individual), training_set_id(bug_ids))
+    with ParallelEvaluator(fitness, corpus, WORKERS, cache=FITNESS_CACHE, key=key, batched=BATCHED) as evaluator:
+        if MINI_BATCH is not None:
+            batches = MiniBatchEvaluator(evaluator, corpus.bug_ids, MINI_BATCH, NUM_ELITES, minimize=True,
+                                         seed=random.getrandbits(64))
+        for _ in tqdm(range(NUM_GENERATIONS)):
+            if MINI_BATCH is not None:
+                fitness_scores = batches.evaluate(populations)
             else:
-                child1, child2 = crossover(random.choices(elites, k = 2))
-                new_populations.append(child1)
-                if len(new_populations) < (NUM_POPULATIONS-NUM_ELITES):
-                    new_populations.append(child2)
-        
-        populations = new_populations
-        assert len(populations) == NUM_POPULATIONS
-
+                rankings = evaluator.evaluate(populations)
+                fitness_scores = [sampled_fitness(ranking, corpus) for ranking in rankings]
+            sorted_fitness_scores = sorted(zip(populations, fitness_scores), key=lambda x: x[1])  # Minimize
+            populations = next_generation(populations, fitness_scores)
+            if SEMANTIC_PROBES and SEMANTIC_DIVERSITY:
+                populations = hasher.replace_duplicates(
+                    populations, lambda: grow_tree(random.randint(2, 4)), start=NUM_ELITES
+                )
+
+    print(f"Fitness cache: {FITNESS_CACHE}")
     return sorted_fitness_scores
 
-def evaluate_formula(formula):
+def evaluate_formula(formula, corpus):
     acc1 = 0
     wefs = []
-    all_bugs = [file.split('_')[0] for file in os.listdir('../sootDAG_filtered')]
-    for bug in all_bugs:
-        with open(f"../bug_data/{bug}.json", 'r') as f:
-            bug_info = json.load(f)
-        
-        spectrum = method_level_spectrum[bug]
-        
-        sbfl_scores = {}
-        buggy_methods = [buggy_lines.split(':')[0] for buggy_lines in bug_info["buggy_lines"]]
-        for method, spectra in spectrum.items():
-            sbfl_scores[method] = eval(str(formula), {}, spectra)
-
-            
-        sorted_sbfl_scores = sorted(sbfl_scores.items(), key=lambda x: x[1], reverse=True)
-        ranks = {method: rank+1 for rank, (method, _) in enumerate(sorted_sbfl_scores)}
-        buggy_methods_ranks = [ranks[buggy_method] for buggy_method in buggy_methods]
-        ranking = min(buggy_methods_ranks)        
+    sbfl_scores = score_corpus(formula, corpus)
+    for bug in corpus.bug_ids:
+        ranking = best_rank(sbfl_scores[bug], corpus.buggy_indices(bug), TIES)
         # print(ranking)
 
         if ranking == 1:
@@ -322,49 +448,45 @@ def evaluate_formula(formula):
     
     return acc1, sum(wefs) / len(wefs)
 
-def evaluate_formula_per_project(formula):
+def evaluate_formula_per_project(formula, corpus):
     wef_dict = {'Math': [], 'Lang': [], 'Time': [], 'Chart': []}
-    for bug, spectrum in method_level_spectrum.items():
-        with open(f"./bug_data/{bug}.json", 'r') as f:
-            bug_info = json.load(f)
-
-        sbfl_scores = {}
-        buggy_methods = [buggy_lines.split(':')[0] for buggy_lines in bug_info["buggy_lines"]]
+    sbfl_scores = score_corpus(formula, corpus)
+    for bug in corpus.bug_ids:
         project = bug.split('-')[0]
         print(project)
-        for method, spectra in spectrum.items():
-            sbfl_scores[method] = eval(str(formula), {}, spectra)
 
-        sorted_sbfl_scores = sorted(sbfl_scores.items(), key=lambda x: x[1], reverse=True)
-        ranks = {method: rank+1 for rank, (method, _) in enumerate(sorted_sbfl_scores)}
-        buggy_methods_ranks = [ranks[buggy_method] for buggy_method in buggy_methods]
-        ranking = min(buggy_methods_ranks)
+        ranking = best_rank(sbfl_scores[bug], corpus.buggy_indices(bug), TIES)
 
         wef_dict[project].append(ranking)
     return wef_dict
 
 
-final_formulae = genetic_programming()
-for f, s in final_formulae:
-    print(str(f), s)
-best_formula = str(final_formulae[0][0])
+if __name__ == "__main__":
+    # 스펙트럼과 정답을 한 번만 로드, GP는 filtered DAG가 있는 버그만 사용
+    corpus = Corpus.load(spectrum_with_p_file, '../bug_data')
+    filtered_corpus = corpus.subset(file.split('_')[0] for file in os.listdir('../sootDAG_filtered'))
+
+    final_formulae = genetic_programming(filtered_corpus)
+    for f, s in final_formulae:
+        print(str(f), s)
+    best_formula = str(final_formulae[0][0])
 
-acc1, wef = evaluate_formula(best_formula)
+    acc1, wef = evaluate_formula(best_formula, filtered_corpus)
 
-print(acc1, wef)
-print(best_formula)
+    print(acc1, wef)
+    print(best_formula)
 
 
-# try1 = "(e_f * (1 if e_p == 0 else e_f/e_p))" # (42, 8.243697478991596)
+    # try1 = "(e_f * (1 if e_p == 0 else e_f/e_p))" # (42, 8.243697478991596)
 
-# baseline = evaluate_formula(try1)
-# print(baseline)
+    # baseline = evaluate_formula(try1, filtered_corpus)
+    # print(baseline)
 
-# wef_dict = evaluate_formula_per_project(try1)
-# wef_Math = sum(wef_dict['Math']) / len(wef_dict['Math'])
-# wef_Lang = sum(wef_dict['Lang']) / len(wef_dict['Lang'])
-# wef_Time = sum(wef_dict['Time']) / len(wef_dict['Time'])
-# wef_Chart = sum(wef_dict['Chart']) / len(wef_dict['Chart'])
+    # wef_dict = evaluate_formula_per_project(try1, corpus)
+    # wef_Math = sum(wef_dict['Math']) / len(wef_dict['Math'])
+    # wef_Lang = sum(wef_dict['Lang']) / len(wef_dict['Lang'])
+    # wef_Time = sum(wef_dict['Time']) / len(wef_dict['Time'])
+    # wef_Chart = sum(wef_dict['Chart']) / len(wef_dict['Chart'])
 
-# print('Math, Lang, Time, Chart')
-# print(wef_Math, wef_Lang, wef_Time, wef_Chart)
+    # print('Math, Lang, Time, Chart')
+    # print(wef_Math, wef_Lang, wef_Time, wef_Chart)
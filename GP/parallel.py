@@ -0,0 +1,131 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+# Corpus of the worker process, set once by _init_worker
+_CORPUS = None
+
+
+def _init_worker(corpus):
+    global _CORPUS
+    _CORPUS = corpus
+
+
+def _evaluate_chunk(fitness, tasks, args, corpus=None, batched=False):
+    """
+    Evaluates (individual, seed) pairs. The global random module is seeded per
+    individual, so a fitness that samples bugs gives the same value on any worker.
+    A batched fitness gets the whole chunk in one call.
+    """
+    corpus = _CORPUS if corpus is None else corpus
+    if batched:
+        return fitness([individual for individual, _ in tasks], *args, corpus)
+    results = []
+    for individual, seed in tasks:
+        random.seed(seed)
+        results.append(fitness(individual, *args, corpus))
+    return results
+
+
+class ParallelEvaluator:
+    """
+    Evaluates the fitness of a whole population on a process pool.
+
+    The corpus is handed to every worker once, when the pool starts. With the fork
+    start method (the Linux default) the workers share the parent's corpus pages
+    instead of copying them; elsewhere it is pickled once per worker. Every
+    individual gets its own seed from a seeded stream, so a run gives the same
+    fitness values for any number of workers, and the caller's random state is
+    never touched.
+
+    Use as a context manager:
+        with ParallelEvaluator(compute_fitness, corpus, workers=32, seed=0) as evaluator:
+            fitnesses = evaluator.evaluate(population)
+    """
+    def __init__(self, fitness, corpus, workers=None, seed=None, cache=None, key=None, batched=False):
+        """
+        :param fitness: Module level function fitness(individual, *args, corpus).
+                        With batched=True fitness(individuals, *args, corpus) -> list
+                        of values, called once per chunk of the population (see
+                        GP/batched.py). A batched fitness must not use random.
+        :param workers: Number of processes, defaults to os.cpu_count(). With 1 the
+                        population is evaluated in this process.
+        :param seed: Seed of the per-individual seed stream.
+        :param cache: Optional FitnessCache. Hits and duplicates within a
+                      population are not sent to the workers.
+        :param key: key(individual, *args) -> cache key, required with a cache.
+        """
+        self.fitness = fitness
+        self.corpus = corpus
+        self.workers = workers or os.cpu_count() or 1
+        self.rng = random.Random(seed)
+        self.cache = cache
+        self.key = key
+        self.batched = batched
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(corpus,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def evaluate(self, population, *args):
+        """
+        :param args: Extra arguments passed to the fitness before the corpus,
+                     e.g. the training bug ids.
+        :return: List of fitness values in population order.
+        """
+        seeds = [self.rng.getrandbits(64) for _ in population]
+        fitnesses = [None] * len(population)
+
+        # key -> positions in the population that share it
+        pending = {}
+        for i, individual in enumerate(population):
+            key = i if self.cache is None else self.key(individual, *args)
+            if key in pending:
+                self.cache.hits += 1
+                pending[key].append(i)
+                continue
+            if self.cache is not None:
+                found, value = self.cache.lookup(key)
+                if found:
+                    fitnesses[i] = value
+                    continue
+            pending[key] = [i]
+
+        tasks = [(population[positions[0]], seeds[positions[0]]) for positions in pending.values()]
+        for (key, positions), value in zip(pending.items(), self._run(tasks, args)):
+            if self.cache is not None:
+                self.cache.put(key, value)
+            for i in positions:
+                fitnesses[i] = value
+        return fitnesses
+
+    def _run(self, tasks, args):
+        if not tasks:
+            return []
+        if self.pool is None:
+            state = random.getstate()
+            try:
+                return _evaluate_chunk(self.fitness, tasks, args, self.corpus, self.batched)
+            finally:
+                random.setstate(state)
+
+        # A few chunks per worker: balances the load and keeps the number of round trips low.
+        # A batched fitness gets one chunk per worker, the larger the batch the better
+        chunks_per_worker = 1 if self.batched else 4
+        chunk_size = max(1, -(-len(tasks) // (self.workers * chunks_per_worker)))
+        chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+        results = []
+        for chunk_results in self.pool.map(_evaluate_chunk, [self.fitness] * len(chunks), chunks, [args] * len(chunks),
+                                           [None] * len(chunks), [self.batched] * len(chunks)):
+            results.extend(chunk_results)
+        return results
@@ -0,0 +1,73 @@
+import random
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+
+def probe_corpus(corpus, size, seed=0):
+    """
+    Fixed probe set: `size` bugs of the corpus drawn with their own seed, so every
+    run, fold and worker uses the same probes.
+    :return: Corpus of the probe bugs, in corpus order.
+    """
+    chosen = set(random.Random(seed).sample(corpus.bug_ids, min(size, len(corpus))))
+    return corpus.subset(bug_id for bug_id in corpus.bug_ids if bug_id in chosen)
+
+
+class SemanticHasher:
+    """
+    Semantic fingerprint of GP individuals: a hash of the order (with ties) the
+    individual puts the methods of a small probe set in. Formulas that only differ
+    by a monotone increasing transform, e.g. e_f and e_f * e_f or e_f + 1, rank every
+    method the same way and share a fingerprint, whatever their trees look like.
+
+    Used as the fitness cache key, an individual whose fingerprint is cached is not
+    scored on the corpus at all. The fingerprint only looks at the probe bugs, so
+    two formulas that order the probe methods the same way but not the other bugs
+    share a fitness: the more probe bugs, the fewer such collisions.
+    """
+    def __init__(self, compile_individual, columns, canonical_key, maxsize=100000):
+        """
+        :param compile_individual: Individual -> vectorized formula (see formula.compile_formula).
+        :param columns: Dictionary of the formula variables over the probe methods.
+        :param canonical_key: Individual -> canonical formula, fingerprints are memoized by it.
+        """
+        self.compile_individual = compile_individual
+        self.columns = columns
+        self.canonical_key = canonical_key
+        self.maxsize = maxsize
+        self._fingerprints = OrderedDict()
+
+    def fingerprint(self, individual):
+        key = self.canonical_key(individual)
+        if key in self._fingerprints:
+            self._fingerprints.move_to_end(key)
+            return self._fingerprints[key]
+
+        scores = self.compile_individual(individual)(**self.columns)
+        # Only the order of the scores counts (ties included), NaNs are one value in np.unique
+        _, order = np.unique(scores, return_inverse=True)
+        fingerprint = hashlib.sha1(order.astype(np.int32).tobytes()).hexdigest()
+
+        self._fingerprints[key] = fingerprint
+        if len(self._fingerprints) > self.maxsize:
+            self._fingerprints.popitem(last=False)
+        return fingerprint
+
+    def replace_duplicates(self, population, new_individual, start=0, attempts=10):
+        """
+        Keeps the population diverse: an individual from position `start` on that
+        behaves like an earlier one is replaced by new_individual(), retried up to
+        `attempts` times until it behaves differently.
+        :return: New population list.
+        """
+        seen = set(self.fingerprint(individual) for individual in population[:start])
+        result = list(population[:start])
+        for individual in population[start:]:
+            for _ in range(attempts):
+                if self.fingerprint(individual) not in seen:
+                    break
+                individual = new_individual()
+            seen.add(self.fingerprint(individual))
+            result.append(individual)
+        return result
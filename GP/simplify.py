@@ -0,0 +1,106 @@
+import numpy as np
+
+# Engine independent formula terms, converted from and to each engine's tree type:
+#   ("var", name), ("const", value), ("add", a, b), ("sub", a, b), ("mul", a, b),
+#   ("div", a, b) with a / 0 = 1 as in every engine, ("sqrt", a) = sqrt(abs(a))
+ZERO = ("const", 0.0)
+ONE = ("const", 1.0)
+
+
+def _fold(op, values):
+    """
+    Value of an operator over constants, computed in float64 like the compiled
+    formula would. None when the result is not finite, the subtree is then kept.
+    """
+    a = np.float64(values[0])
+    with np.errstate(all="ignore"):
+        if op == "sqrt":
+            result = np.sqrt(np.abs(a))
+        else:
+            b = np.float64(values[1])
+            if op == "add":
+                result = a + b
+            elif op == "sub":
+                result = a - b
+            elif op == "mul":
+                result = a * b
+            else:
+                result = a / b if b != 0 else np.float64(1.0)
+    return float(result) if np.isfinite(result) else None
+
+
+def _finite(term):
+    """
+    Division only can turn finite terminals into inf or NaN (x / 1e-300), so a
+    subtree without division is finite and x - x, x * 0, x / x are exact for it.
+    """
+    if term[0] == "div":
+        return False
+    return all(_finite(child) for child in term[1:] if isinstance(child, tuple))
+
+
+def _same(a, b):
+    """Equal terms, up to the operand order of + and * (IEEE + and * are commutative)."""
+    if a[0] != b[0]:
+        return False
+    if a[0] in ("var", "const"):
+        return a[1] == b[1]
+    if a[0] in ("add", "mul"):
+        return (_same(a[1], b[1]) and _same(a[2], b[2])) or (_same(a[1], b[2]) and _same(a[2], b[1]))
+    return all(_same(x, y) for x, y in zip(a[1:], b[1:]))
+
+
+def simplify(term):
+    """
+    Bottom-up constant folding, identity removal (x + 0, x - 0, x * 1, x / 1) and
+    dead subtree removal (x - x, x * 0, x / x, x / 0). Every rewrite gives the same
+    float64 value on every method as the original formula, so the fitness does not
+    change; rewrites that would only hold for finite values are limited to subtrees
+    without division.
+    :return: Simplified term, the term itself when nothing could be simplified.
+    """
+    op = term[0]
+    if op in ("var", "const"):
+        return term
+
+    children = tuple(simplify(child) for child in term[1:])
+    if all(child[0] == "const" for child in children):
+        value = _fold(op, [child[1] for child in children])
+        if value is not None:
+            return ("const", value)
+    if op == "sqrt":
+        return (op, children[0])
+
+    a, b = children
+    if op == "add":
+        if b == ZERO:
+            return a
+        if a == ZERO:
+            return b
+    elif op == "sub":
+        if b == ZERO:
+            return a
+        if _same(a, b) and _finite(a):
+            return ZERO
+    elif op == "mul":
+        if b == ONE:
+            return a
+        if a == ONE:
+            return b
+        if (a == ZERO and _finite(b)) or (b == ZERO and _finite(a)):
+            return ZERO
+    elif op == "div":
+        if b == ZERO:
+            return ONE
+        if b == ONE:
+            return a
+        if _same(a, b) and _finite(a):
+            return ONE
+    return (op, a, b)
+
+
+def format_constant(value):
+    """Constant as formula text, integers without a decimal point as the engines write them."""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
@@ -1,12 +1,29 @@
 import os
+import sys
 import json
 import pandas as pd
 import numpy as np
 import random
-import math
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from sklearn.model_selection import KFold
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from corpus import Corpus
+from ground_truth import load_ground_truth
+from spectrum_arrays import load_spectrum_json
+from formula import compile_formula
+from ranking import buggy_ranks
+from fitness_cache import FitnessCache, canonical_form, training_set_id
+from parallel import ParallelEvaluator
+from islands import IslandEngine, check_options, run_islands
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from minibatch import MiniBatchEvaluator
+from batched import population_ranks
+from simplify import simplify
+from semantic import SemanticHasher, probe_corpus
+
 warnings.filterwarnings("ignore")
 
 # 터미널과 연산자를 정의합니다.
@@ -22,11 +39,46 @@ TOURNAMENT_SIZE = 2
 MUTATION_RATE = 0.1
 CROSSOVER_RATE = 0.7
 ELITISM = True
+TIES = "stable"  # 동점 처리 방식, ranking.TIE_POLICIES 참고
 
 K_FOLDS = 20
-
-# new_spectrum.json 파일 로드
-# 구조 예시:
+FITNESS_CACHE_SIZE = 100000
+# 동시에 실행할 fold 수, 1이면 순서대로. 2 이상이면 fold들의 진행 출력이 섞이므로 LOG_FILE 의 fold 필드로 구분
+FOLD_WORKERS = 1
+WORKERS = os.cpu_count()  # 적합도 계산 프로세스 수, 1이면 병렬 처리 안함 (fold 병렬 시 fold당 cpu_count // FOLD_WORKERS)
+RANDOM_SEED = None  # fold별 seed와 적합도 계산 seed를 만드는 seed
+LOG_FILE = "sunwoo_cv_log.jsonl"  # fold/세대별 진행 상황 (JSON lines), 기록마다 실행을 구분하는 run_id
+RUN_ID = None  # main()에서 실행마다 새로 정함
+
+# island 모델: ISLANDS 개의 집단(각 POPULATION_SIZE)이 각자의 프로세스에서 진화하고
+# MIGRATION_INTERVAL 세대마다 상위 MIGRATION_SIZE 개체를 옆 island로 보냅니다. 1이면 사용 안함
+# island 프로세스는 최대 WORKERS 개, checkpoint는 fold 단위로만 저장.
+# MINI_BATCH, BATCHED, SEMANTIC_PROBES 와 함께 쓸 수 없음 (ValueError)
+ISLANDS = 1
+MIGRATION_INTERVAL = 5
+MIGRATION_SIZE = 2
+
+# mini-batch 적합도: 세대마다 학습 버그 중 MINI_BATCH 비율만 뽑아 모든 개체를 평가하고,
+# 상위 MINI_BATCH_TOP 개체만 전체 학습 버그로 다시 평가합니다. None이면 항상 전체 학습 버그로 평가
+MINI_BATCH = None
+MINI_BATCH_TOP = 5
+# True면 개체마다 버그별로 계산하지 않고 집단 전체를 (개체 x 메소드) 점수 행렬로 한 번에 계산 (GP/batched.py)
+BATCHED = False
+# True면 교차/변이로 만든 개체를 적합도가 같은 더 작은 식으로 정리 (상수 계산, x + 0, x - x 등 제거, GP/simplify.py)
+SIMPLIFY = False
+# 적합도 캐시를 식 대신 SEMANTIC_PROBES 개 probe 버그에서의 메소드 순위(semantic fingerprint)로 찾습니다.
+# 순위가 같은 식(단조 변환 등)은 다시 계산하지 않음. None이면 사용 안함 (GP/semantic.py)
+SEMANTIC_PROBES = None
+SEMANTIC_DIVERSITY = False  # True면 이미 있는 개체와 순위가 같은 자식을 새 랜덤 개체로 교체
+
+# fold별 진행 상황(집단, 난수 상태, 최고 개체)을 CHECKPOINT_INTERVAL 세대마다 저장합니다.
+# 중단된 실행은 python sunwoo_gp.py --resume 으로 이어서 실행 (끝난 fold는 다시 실행하지 않음)
+CHECKPOINT_DIR = "sunwoo_checkpoints"  # None이면 저장 안함
+CHECKPOINT_INTERVAL = 5
+RESUME = "--resume" in sys.argv
+
+SPECTRUM_FILE = "new_spectrum.json"
+# new_spectrum.json 구조 예시:
 # {
 #   "Chart-1": {
 #       "org.jfree.chart$ChartColor#<clinit>()": {
@@ -40,32 +92,33 @@ K_FOLDS = 20
 #   },
 #   ...
 # }
-with open("new_spectrum.json", "r") as f:
-    SPECTRUM_DATA = json.load(f)
+# main()에서 Corpus로 한 번만 로드하여 모든 함수에 넘겨줍니다.
 
+# (정규화된 식, 학습 버그 집합) -> 적합도
+FITNESS_CACHE = FitnessCache(FITNESS_CACHE_SIZE)
 
-def get_all_bug_ids():
-    # new_spectrum.json 의 key들이 bug_id 목록
-    return list(SPECTRUM_DATA.keys())
 
+def get_all_bug_ids(spectra):
+    # new_spectrum.json 의 key들이 bug_id 목록 (ground truth가 없는 버그도 포함해 KFold 분할이 기존과 같음)
+    return list(spectra.keys())
 
-def load_bug_info(bug_id):
-    bug_info_path = os.path.join(f"./bug_data/{bug_id}.json")
-    if not os.path.exists(bug_info_path):
-        raise FileNotFoundError(f"Bug info file missing for {bug_id}")
 
-    with open(bug_info_path, "r") as f:
-        bug_info = json.load(f)
-    return bug_info
+def get_contexts(spectrum):
+    """
+    x = e_f/(e_f+n_f), y = e_p/(e_p+n_p) 를 메소드 전체에 대해 한 번에 계산합니다.
+    BugSpectrum 대신 Corpus를 넘기면 모든 버그의 메소드에 대해 계산합니다.
+    """
+    failed = spectrum.e_f + spectrum.n_f
+    passed = spectrum.e_p + spectrum.n_p
+    x = np.divide(spectrum.e_f, failed, out=np.zeros(len(failed)), where=failed > 0)
+    y = np.divide(spectrum.e_p, passed, out=np.zeros(len(passed)), where=passed > 0)
+    return x, y, spectrum.p
 
 
-def get_labels(method_names, bug_info):
-    # bug_info에서 buggy_lines (or buggy_methods) 를 로드
-    buggy_methods = bug_info.get("buggy_lines", [])
-    parsed_buggy_methods = set([buggy_method.split(":")[0] for buggy_method in buggy_methods])
-    # print(f"parsed = {parsed_buggy_methods}")
-    # method_names 리스트와 비교
-    labels = np.array([1 if m in parsed_buggy_methods else 0 for m in method_names])
+def get_labels(corpus, bug_id):
+    # buggy 메소드 위치에 1, 나머지 0
+    labels = np.zeros(corpus.num_methods(bug_id), dtype=int)
+    labels[corpus.buggy_indices(bug_id)] = 1
     return labels
 
 
@@ -74,42 +127,36 @@ class Node:
         self.value = value  # 연산자 또는 터미널 값 또는 상수
         self.children = children  # 하위 노드 리스트
 
-    def evaluate(self, context):
-        """현재 노드를 평가합니다."""
-        try:
-            if self.value == 'x':
-                return context['x']
-            elif self.value == 'y':
-                return context['y']
-            elif self.value == 'p':
-                return context['p']
-            elif isinstance(self.value, float):  # 상수인 경우
-                return self.value
-            elif self.value == 'add':
-                return self.children[0].evaluate(context) + self.children[1].evaluate(context)
-            elif self.value == 'sub':
-                return self.children[0].evaluate(context) - self.children[1].evaluate(context)
-            elif self.value == 'mul':
-                return self.children[0].evaluate(context) * self.children[1].evaluate(context)
-            elif self.value == 'div':
-                denominator = self.children[1].evaluate(context)
-                if denominator == 0:
-                    return 1.0  # 안전한 나눗셈
-                return self.children[0].evaluate(context) / denominator
-            elif self.value == 'sqrt':
-                operand = self.children[0].evaluate(context)
-                return math.sqrt(abs(operand))  # 음수 처리
-            else:
-                raise Exception(f"Unknown function: {self.value}")
-        except:
-            return 0.0  # 계산 중 오류 발생 시 0 반환
+    def to_expression(self):
+        """
+        formula.compile_formula 로 벡터화할 수 있는 식을 반환합니다.
+        나눗셈은 분모가 0이면 1.0, sqrt 는 음수 처리를 위해 abs 를 씌웁니다.
+        """
+        if self.value in ['x', 'y', 'p']:
+            return self.value
+        elif isinstance(self.value, float):  # 상수인 경우
+            return repr(self.value)
+        elif self.value == 'add':
+            return f"({self.children[0].to_expression()} + {self.children[1].to_expression()})"
+        elif self.value == 'sub':
+            return f"({self.children[0].to_expression()} - {self.children[1].to_expression()})"
+        elif self.value == 'mul':
+            return f"({self.children[0].to_expression()} * {self.children[1].to_expression()})"
+        elif self.value == 'div':
+            return f"safe_divide({self.children[0].to_expression()}, {self.children[1].to_expression()}, 1.0)"
+        elif self.value == 'sqrt':
+            return f"math.sqrt(abs({self.children[0].to_expression()}))"
+        else:
+            raise Exception(f"Unknown function: {self.value}")
 
     def __str__(self):
         """노드를 실행 가능한 Python 코드 형태로 반환합니다."""
         if self.value in ['x', 'y', 'p']:
             return self.value
         elif isinstance(self.value, float):
-            return f"{self.value:.2f}"
+            # 상수 계산(SIMPLIFY)으로 생긴 소수점 3자리 이상의 값은 계산에 쓰는 값 그대로 출력
+            text = f"{self.value:.2f}"
+            return text if float(text) == self.value else repr(self.value)
         elif self.value in FUNCTIONS:
             if self.value == 'sqrt':
                 return f"math.sqrt({self.children[0]})"
@@ -124,11 +171,53 @@ class Node:
         else:
             raise Exception(f"Unknown function: {self.value}")
 
+    def canonical_key(self):
+        """add, mul 의 피연산자 순서를 정규화한 식. 적합도 캐시의 키로 사용합니다."""
+        if not self.children:
+            return self.value if self.value in ['x', 'y', 'p'] else repr(self.value)
+        return canonical_form(self.value, [child.canonical_key() for child in self.children])
+
     def copy(self):
         """노드를 복사합니다."""
         return Node(self.value, [child.copy() for child in self.children])
 
 
+def to_term(node):
+    """Node 를 simplify.py 의 term 으로 변환합니다."""
+    if node.value in ['x', 'y', 'p']:
+        return ("var", node.value)
+    if isinstance(node.value, float):
+        return ("const", node.value)
+    return (node.value, *[to_term(child) for child in node.children])
+
+
+def from_term(term):
+    if term[0] == "var":
+        return Node(term[1])
+    if term[0] == "const":
+        return Node(float(term[1]))
+    return Node(term[0], [from_term(child) for child in term[1:]])
+
+
+def simplify_individual(individual):
+    """적합도가 같은 더 작은 식을 반환합니다."""
+    return from_term(simplify(to_term(individual)))
+
+
+def semantic_hasher(corpus):
+    """probe 버그의 x, y, p 로 개체의 semantic fingerprint 를 계산하는 SemanticHasher"""
+    x_vals, y_vals, p_vals = get_contexts(probe_corpus(corpus, SEMANTIC_PROBES))
+    return SemanticHasher(compile_individual, {"x": x_vals, "y": y_vals, "p": p_vals}, Node.canonical_key)
+
+
+def compile_individual(individual):
+    """
+    개체를 메소드 전체의 x, y, p 배열을 받는 벡터 함수로 컴파일합니다.
+    같은 식은 formula.compile_formula 의 캐시에서 재사용됩니다.
+    """
+    return compile_formula(individual.to_expression())
+
+
 def random_terminal():
     """x, y, p, 상수 중 하나를 랜덤하게 반환합니다."""
     choices = ['x', 'y', 'p', 'const']
@@ -183,51 +272,40 @@ def crossover(parent1, parent2):
         return new_node
 
 
-def fitness_function(individual, bug_ids):
+def fitness_function(individual, bug_ids, corpus):
+    """
+    같은 식(교환 법칙까지 같은 식 포함)이 같은 학습 버그 집합에서 이미 평가되었다면
+    캐시된 적합도를 반환합니다.
+    """
+    return FITNESS_CACHE.get(fitness_key(individual, bug_ids), lambda: compute_fitness(individual, bug_ids, corpus))
+
+
+def fitness_key(individual, bug_ids):
+    return (individual.canonical_key(), training_set_id(bug_ids))
+
+
+def compute_fitness(individual, bug_ids, corpus):
     total_fitness = 0.0
     num_bug_ids = 0
 
     for bug_id in bug_ids:
         try:
-            # bug_info 로드
-            bug_info = load_bug_info(bug_id)
-            # new_spectrum.json에서 bug_id에 해당하는 메소드 정보 로드
-            if bug_id not in SPECTRUM_DATA:
+            # corpus에서 bug_id에 해당하는 메소드 정보
+            if bug_id not in corpus:
                 # 해당 bug_id에 대한 스펙트럼 정보 없음
                 continue
-            methods_data = SPECTRUM_DATA[bug_id]
+            spectrum = corpus.spectrum(bug_id)
             # print(f"bug-id = {bug_id}, formula = {individual}")
-            # 메소드명과 e_p, n_p, e_f, n_f, p 추출
-            method_names = list(methods_data.keys())
-            labels = get_labels(method_names, bug_info)
-            # print(f"labels = {labels}")
+            buggy_method_indices = corpus.buggy_indices(bug_id)
 
             # 각 메소드별로 x, y, p 계산
             # x = e_f/(e_f+n_f), y = e_p/(e_p+n_p), p는 이미 있음
-            scores = []
-            for i, method in enumerate(method_names):
-                m_data = methods_data[method]
-                e_p = m_data.get('e_p', 0)
-                n_p = m_data.get('n_p', 0)
-                e_f = m_data.get('e_f', 0)
-                n_f = m_data.get('n_f', 0)
-                p_val = m_data.get('p', 0.0)
-
-                x_val = e_f / (e_f + n_f) if (e_f + n_f) > 0 else 0.0
-                y_val = e_p / (e_p + n_p) if (e_p + n_p) > 0 else 0.0
-
-                context = {'x': x_val, 'y': y_val, 'p': p_val}
-                score = individual.evaluate(context)
-                scores.append(score)
-                # print(f"method = {method}, context = {context}, score = {score}")
-
-            # 점수로 내림차순 정렬
-            methods_list = list(zip(method_names, scores, labels))
-            methods_list.sort(key=lambda x: x[1], reverse=True)
+            x_vals, y_vals, p_vals = get_contexts(spectrum)
+            scores = compile_individual(individual)(x=x_vals, y=y_vals, p=p_vals)
 
-            total_methods = len(methods_list)
-            buggy_indices = [index for index, (_, _, label) in enumerate(methods_list) if label == 1]
-            # print(methods_list)
+            # 정렬 없이 내림차순 정렬 시 buggy 메소드의 위치(0부터)를 계산
+            total_methods = len(scores)
+            buggy_indices = (buggy_ranks(scores, buggy_method_indices, TIES) - 1).tolist()
             # print(buggy_indices)
             if not buggy_indices:
                 avg_wef = total_methods
@@ -249,7 +327,30 @@ def fitness_function(individual, bug_ids):
         return total_fitness / num_bug_ids
 
 
-def fitness_function_with_output(individual, bug_ids):
+def compute_population_fitness(individuals, bug_ids, corpus):
+    """compute_fitness 를 집단 전체에 대해 한 번에 계산합니다 (GP/batched.py)."""
+    bug_ids = [bug_id for bug_id in bug_ids if bug_id in corpus]
+    if not bug_ids:
+        return [0.0] * len(individuals)
+
+    functions = [compile_individual(individual) for individual in individuals]
+    x_vals, y_vals, p_vals = get_contexts(corpus)
+    ranks = population_ranks(functions, corpus, {"x": x_vals, "y": y_vals, "p": p_vals}, bug_ids, TIES)
+
+    total_fitness = np.zeros(len(individuals))
+    for bug_id in bug_ids:
+        total_methods = corpus.num_methods(bug_id)
+        num_buggy = ranks[bug_id].shape[1]
+        if num_buggy == 0:
+            avg_wef = total_methods
+        else:
+            avg_wef = (ranks[bug_id] - 1).sum(axis=1) / num_buggy + 1
+        total_fitness += total_methods / avg_wef
+
+    return (total_fitness / len(bug_ids)).tolist()
+
+
+def fitness_function_with_output(individual, bug_ids, corpus):
     """
     엘리트 개체의 적합도 계산 및 그룹별 상위 10개 버그 출력
     """
@@ -266,26 +367,22 @@ def fitness_function_with_output(individual, bug_ids):
 
     for bug_id in bug_ids:
         try:
-            bug_info = load_bug_info(bug_id)
-            if bug_id not in SPECTRUM_DATA:
+            if bug_id not in corpus:
                 continue
-            methods_data = SPECTRUM_DATA[bug_id]
-            method_names = list(methods_data.keys())
-            labels = get_labels(method_names, bug_info)
+            spectrum = corpus.spectrum(bug_id)
+            method_names = spectrum.methods
+            labels = get_labels(corpus, bug_id)
 
+            x_vals, y_vals, p_vals = get_contexts(spectrum)
+            scores = compile_individual(individual)(x=x_vals, y=y_vals, p=p_vals)
             statement_data = []
             for i, method in enumerate(method_names):
-                m_data = methods_data[method]
-                e_p = m_data.get('e_p', 0)
-                n_p = m_data.get('n_p', 0)
-                e_f = m_data.get('e_f', 0)
-                n_f = m_data.get('n_f', 0)
-                p_val = m_data.get('p', 0.0)
-                x_val = e_f / (e_f + n_f) if (e_f + n_f) > 0 else 0.0
-                y_val = e_p / (e_p + n_p) if (e_p + n_p) > 0 else 0.0
-
-                context = {'x': x_val, 'y': y_val, 'p': p_val}
-                score = individual.evaluate(context)
+                e_p = int(spectrum.e_p[i])
+                n_p = int(spectrum.n_p[i])
+                e_f = int(spectrum.e_f[i])
+                n_f = int(spectrum.n_f[i])
+                x_val, y_val, p_val = x_vals[i], y_vals[i], p_vals[i]
+                score = scores[i]
                 label = labels[i]
                 statement_data.append((method, score, label, e_p, e_f, n_p, n_f, x_val, y_val, p_val))
 
@@ -368,66 +465,228 @@ def tournament_selection(population, fitnesses):
     return selected[0][0]
 
 
-def evolve(training_data, all_bug_ids):
-    population = [generate_random_tree(MAX_DEPTH) for _ in range(POPULATION_SIZE)]
-    best_individual = None
-    best_fitness = -1
-    all_formulas = []
+def log_event(event, **fields):
+    """LOG_FILE 에 이벤트 하나를 JSON 한 줄로 추가합니다. 여러 fold 프로세스가 같은 파일에 씁니다."""
+    record = {"time": time.time(), "run_id": RUN_ID, "event": event, **fields}
+    with open(LOG_FILE, "a") as f:
+        f.write(json.dumps(record) + "\n")
 
-    for generation in range(NUM_GENERATIONS):
-        fitnesses = [fitness_function(ind, training_data) for ind in population]
-        idx = np.argmax(fitnesses)
-        best_individual = population[idx]
 
-        if ELITISM:
-            new_population = [best_individual]
-        else:
-            new_population = []
+def random_population(size):
+    return [generate_random_tree(MAX_DEPTH) for _ in range(size)]
+
 
-        while len(new_population) < POPULATION_SIZE:
-            parent1 = tournament_selection(population, fitnesses)
-            parent2 = tournament_selection(population, fitnesses)
-            child = crossover(parent1, parent2)
-            child = mutate(child, MAX_DEPTH)
-            new_population.append(child)
+def next_generation(population, fitnesses):
+    """엘리트 보존, 토너먼트 선택, 교차, 변이로 다음 세대를 만듭니다."""
+    if ELITISM:
+        new_population = [population[np.argmax(fitnesses)]]
+    else:
+        new_population = []
+
+    while len(new_population) < POPULATION_SIZE:
+        parent1 = tournament_selection(population, fitnesses)
+        parent2 = tournament_selection(population, fitnesses)
+        child = crossover(parent1, parent2)
+        child = mutate(child, MAX_DEPTH)
+        if SIMPLIFY:
+            child = simplify_individual(child)
+        new_population.append(child)
+    return new_population
+
+
+ISLAND_ENGINE = IslandEngine(random_population, next_generation, fitness_function, minimize=False)
+
+
+def checkpoint_path(fold):
+    """fold의 checkpoint 파일 경로, 저장하지 않으면 None"""
+    if CHECKPOINT_DIR is None or fold is None:
+        return None
+    return os.path.join(CHECKPOINT_DIR, f"fold_{fold}.pkl.gz")
+
+
+def evolve(training_data, all_bug_ids, corpus, fold=None):
+    if ISLANDS > 1:
+        return evolve_islands(training_data, all_bug_ids, corpus, fold)
+
+    path = checkpoint_path(fold)
+    state = load_checkpoint(path) if RESUME and path else None
+    if state is not None and "population" in state:
+        # 저장된 세대부터 이어서 진행
+        population = state["population"]
+        best_individual = state["best_individual"]
+        all_formulas = state["all_formulas"]
+        start = state["generation"]
+        log_event("resume", fold=fold, generation=start)
+    else:
+        state = None
+        population = random_population(POPULATION_SIZE)
+        best_individual = None
+        all_formulas = []
+        start = 0
+
+    # 개체들의 적합도를 프로세스 풀에서 병렬로 계산 (캐시에 있는 식은 제외)
+    fitness = compute_population_fitness if BATCHED else compute_fitness
+    key = fitness_key
+    if SEMANTIC_PROBES:
+        hasher = semantic_hasher(corpus)
+        key = lambda individual, bug_ids: (hasher.fingerprint(individual), training_set_id(bug_ids))
+    with ParallelEvaluator(fitness, corpus, WORKERS, RANDOM_SEED, FITNESS_CACHE, key, BATCHED) as evaluator:
+        if MINI_BATCH is not None:
+            batches = MiniBatchEvaluator(evaluator, training_data, MINI_BATCH, MINI_BATCH_TOP, minimize=False,
+                                         seed=random.getrandbits(64))
+        if state is not None:
+            random.setstate(state["random_state"])
+            evaluator.rng.setstate(state["evaluator_state"])
+            if MINI_BATCH is not None:
+                batches.rng.setstate(state["batch_state"])
+        for generation in range(start, NUM_GENERATIONS):
+            if MINI_BATCH is not None:
+                fitnesses = batches.evaluate(population)
+            else:
+                fitnesses = evaluator.evaluate(population, training_data)
+            idx = np.argmax(fitnesses)
+            best_individual = population[idx]
+            population = next_generation(population, fitnesses)
+            if SEMANTIC_PROBES and SEMANTIC_DIVERSITY:
+                population = hasher.replace_duplicates(
+                    population, lambda: generate_random_tree(MAX_DEPTH), start=1 if ELITISM else 0
+                )
+
+            all_formulas.append((generation + 1, str(best_individual)))
+
+            print(f"\n=== Fold {fold}, Generation {generation + 1} ===", flush=True)
+            print(f"Best Individual Formula: {best_individual}", flush=True)
+            print(f"Fitness cache: {FITNESS_CACHE}", flush=True)
+            overall_fitness = fitness_function_with_output(best_individual, all_bug_ids, corpus)
+            log_event(
+                "generation", fold=fold, generation=generation + 1, formula=str(best_individual),
+                fitness=float(fitnesses[idx]), overall_fitness=overall_fitness, cache_hit_rate=FITNESS_CACHE.hit_rate,
+            )
+
+            if path and (generation + 1) % CHECKPOINT_INTERVAL == 0 and generation + 1 < NUM_GENERATIONS:
+                save_checkpoint(path, {
+                    "fold": fold, "generation": generation + 1, "population": population,
+                    "best_individual": best_individual, "all_formulas": all_formulas,
+                    "random_state": random.getstate(), "evaluator_state": evaluator.rng.getstate(),
+                    "batch_state": batches.rng.getstate() if MINI_BATCH is not None else None,
+                })
 
-        population = new_population
+    return best_individual, all_formulas
 
-        all_formulas.append((generation + 1, str(best_individual)))
 
-        print(f"\n=== Generation {generation + 1} ===", flush=True)
-        print(f"Best Individual Formula: {best_individual}", flush=True)
-        fitness_function_with_output(best_individual, all_bug_ids)
+def evolve_islands(training_data, all_bug_ids, corpus, fold=None):
+    """evolve 의 island 모델 버전. 세대별 대신 migration 주기마다 전체 최고 개체를 기록합니다."""
+    check_options(MINI_BATCH=MINI_BATCH, BATCHED=BATCHED, SEMANTIC_PROBES=SEMANTIC_PROBES,
+                  SEMANTIC_DIVERSITY=SEMANTIC_DIVERSITY)
+    all_formulas = []
 
+    def on_epoch(generation, best_individual, best_fitness):
+        all_formulas.append((generation, str(best_individual)))
+        print(f"\n=== Fold {fold}, Generation {generation} ({ISLANDS} islands) ===", flush=True)
+        print(f"Best Individual Formula: {best_individual}", flush=True)
+        overall_fitness = fitness_function_with_output(best_individual, all_bug_ids, corpus)
+        log_event(
+            "generation", fold=fold, generation=generation, formula=str(best_individual),
+            fitness=float(best_fitness), overall_fitness=overall_fitness, islands=ISLANDS,
+        )
+
+    best_individual, _, _ = run_islands(
+        ISLAND_ENGINE, corpus, (training_data,), ISLANDS, POPULATION_SIZE, NUM_GENERATIONS,
+        MIGRATION_INTERVAL, MIGRATION_SIZE, seed=random.getrandbits(64), on_epoch=on_epoch, workers=WORKERS,
+    )
     return best_individual, all_formulas
 
 
+# fold 프로세스의 corpus, _init_fold_worker 가 한 번 설정
+_FOLD_CORPUS = None
+
+
+def _init_fold_worker(corpus, workers, run_id):
+    global _FOLD_CORPUS, WORKERS, RUN_ID
+    _FOLD_CORPUS = corpus
+    WORKERS = workers
+    RUN_ID = run_id
+
+
+def run_fold(fold, training_data, validation_data, all_bug_ids, seed, corpus=None):
+    """fold 하나를 학습하고 검증합니다. fold마다 seed를 따로 두어 실행 순서와 상관없이 같은 결과를 냅니다."""
+    corpus = _FOLD_CORPUS if corpus is None else corpus
+    path = checkpoint_path(fold)
+    state = load_checkpoint(path) if RESUME and path else None
+    if state is not None and "result" in state:
+        # 중단 전에 끝난 fold
+        log_event("fold_resumed", fold=fold)
+        return (fold, *state["result"])
+
+    random.seed(seed)
+    log_event("fold_start", fold=fold, train=len(training_data), validation=len(validation_data))
+
+    best_individual, formulas = evolve(training_data, all_bug_ids, corpus, fold)
+    val_fitness = fitness_function(best_individual, validation_data, corpus)
+
+    if path:
+        save_checkpoint(path, {"fold": fold, "result": (best_individual, val_fitness, formulas)})
+    log_event("fold_done", fold=fold, formula=str(best_individual), validation_fitness=val_fitness)
+    return fold, best_individual, val_fitness, formulas
+
+
+def run_folds(folds, all_bug_ids, corpus):
+    """
+    fold들을 FOLD_WORKERS 개의 프로세스에서 동시에 실행하고, 끝나는 순서대로 결과를 돌려줍니다.
+    :param folds: (fold 번호, training bug ids, validation bug ids) 리스트
+    """
+    seed_stream = random.Random(RANDOM_SEED)
+    tasks = [(fold, training_data, validation_data, all_bug_ids, seed_stream.getrandbits(64))
+             for fold, training_data, validation_data in folds]
+
+    if FOLD_WORKERS <= 1:
+        for task in tasks:
+            yield run_fold(*task, corpus)
+        return
+
+    # fold 프로세스들이 cpu를 나눠 쓰도록 fold당 적합도 계산 프로세스 수를 줄임
+    workers = max(1, (os.cpu_count() or 1) // FOLD_WORKERS)
+    with ProcessPoolExecutor(FOLD_WORKERS, initializer=_init_fold_worker, initargs=(corpus, workers, RUN_ID)) as pool:
+        futures = [pool.submit(run_fold, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 def main():
-    bug_ids = get_all_bug_ids()
-    kf = KFold(n_splits=K_FOLDS, shuffle=True, random_state=42)
-    bug_ids = np.array(bug_ids)
+    global RUN_ID
+    RUN_ID = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    log_event("run_start", k_folds=K_FOLDS, fold_workers=FOLD_WORKERS, islands=ISLANDS, resume=RESUME)
+    spectra = load_spectrum_json(SPECTRUM_FILE)
+    corpus = Corpus.from_spectra(spectra, load_ground_truth(SPECTRUM_FILE))
+    bug_ids = np.array(get_all_bug_ids(spectra))
+
+    # ground truth가 없는 버그는 fold 분할에는 포함하고 학습/검증에서만 제외
+    skipped = [str(bug_id) for bug_id in bug_ids if bug_id not in corpus]
+    if skipped:
+        print(f"Skipping {len(skipped)} bugs without ground truth: {skipped}", flush=True)
+        log_event("skipped_bugs", bug_ids=skipped)
+    known = np.array([bug_id in corpus for bug_id in bug_ids], dtype=bool)
 
-    best_formulas = []
-    fold = 1
-    all_generations_formulas = []
+    kf = KFold(n_splits=K_FOLDS, shuffle=True, random_state=42)
+    folds = [(fold, bug_ids[train_index[known[train_index]]], bug_ids[test_index[known[test_index]]])
+             for fold, (train_index, test_index) in enumerate(kf.split(bug_ids), 1)]
+    bug_ids = bug_ids[known]
 
-    for train_index, test_index in kf.split(bug_ids):
+    results = {}
+    for fold, best_individual, val_fitness, formulas in run_folds(folds, bug_ids, corpus):
         print(f"\n=== Fold {fold} ===", flush=True)
-        training_data = bug_ids[train_index]
-        validation_data = bug_ids[test_index]
-
-        best_individual, formulas = evolve(training_data, bug_ids)
-        val_fitness = fitness_function(best_individual, validation_data)
         print(f"\nValidation Fitness (Avg Total_Methods / Avg_WEF): {val_fitness:.6f}", flush=True)
         print(f"Evolved Formula: {best_individual}", flush=True)
+        results[fold] = (best_individual, val_fitness, formulas)
 
-        all_generations_formulas.extend([(fold, gen, form) for gen, form in formulas])
-        best_formulas.append((best_individual, val_fitness))
-        fold += 1
+    # 모든 fold가 끝난 뒤에 fold 순서대로 모아서 최종 식을 선택
+    best_formulas = [(results[fold][0], results[fold][1]) for fold in sorted(results)]
+    all_generations_formulas = [(fold, gen, form) for fold in sorted(results) for gen, form in results[fold][2]]
 
     best_formulas.sort(key=lambda x: x[1], reverse=True)
     final_formula = best_formulas[0][0]
     print(f"\nBest Formula after K-Fold CV:\n{final_formula}", flush=True)
+    log_event("cv_done", formula=str(final_formula), validation_fitness=best_formulas[0][1])
 
     with open('best_formula_by_wef.txt', 'w') as f:
         f.write(str(final_formula))
@@ -436,6 +695,11 @@ def main():
     for fold, generation, formula in all_generations_formulas:
         print(f"Fold {fold}, Generation {generation}: {formula}")
 
+    # 끝까지 실행했으므로 checkpoint는 더 이상 필요 없음
+    for fold, _, _ in folds:
+        if checkpoint_path(fold):
+            remove_checkpoint(checkpoint_path(fold))
+
 
 if __name__ == '__main__':
     main()
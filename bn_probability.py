@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from coverage_store import pack_bits, WORD_BITS
+
+
+class FailureProbabilityEngine:
+    """
+    P(Fail|Node) of the methods of one bug. Only the failing-test columns of the
+    method coverage are extracted, once, as one bitmap per method (uint64 words as
+    in coverage_store), and method names are mapped to row ids once. The failing
+    tests covered by a set of methods are then the bitwise OR of their bitmaps, so
+    a node costs out-degree x failing-test words, independent of the matrix size.
+
+    failure_probabilities computes every node of a PDG at once with sparse matrix
+    products instead, for call graphs too large for a Python loop over the nodes.
+    """
+    def __init__(self, method_coverage, failing_tests):
+        """
+        :param method_coverage: CoverageStore whose rows are methods.
+        :param failing_tests: Ids of the failing tests.
+        """
+        failing = set(failing_tests)
+        columns = np.array([j for j, test in enumerate(method_coverage.tests) if test in failing], dtype=np.int64)
+        words = np.asarray(method_coverage.bits[:, columns // WORD_BITS])
+        covered = (words >> (columns % WORD_BITS).astype(np.uint64)) & np.uint64(1)
+
+        self.failing_bits = pack_bits(covered.astype(bool))
+        # The same columns as a sparse (methods x failing tests) matrix for failure_probabilities
+        self.failing = sp.csr_matrix(covered.astype(np.int32))
+        self.lines = pd.Index(method_coverage.lines)
+        self.method_ids = {method: i for i, method in enumerate(method_coverage.lines)}
+        self.total_test = len(method_coverage.tests)
+
+    def failing_on(self, method_ids):
+        """
+        :return: Bitmap of the failing tests covered by at least one of the methods.
+        """
+        if not method_ids:
+            return np.zeros(self.failing_bits.shape[1], dtype=self.failing_bits.dtype)
+        return np.bitwise_or.reduce(self.failing_bits[method_ids], axis=0)
+
+    def terms(self, node, successors):
+        """
+        :param node: Method name of a PDG node, must be in the coverage.
+        :param successors: Method names of its PDG successors, unknown ones are ignored.
+        :return: (a, b) with a the failing tests that cover the node but none of its
+                 successors and b the tests that do not fail on any successor.
+        """
+        successor_bits = self.failing_on([self.method_ids[line] for line in successors if line in self.method_ids])
+        b = self.total_test - int(np.bitwise_count(successor_bits).sum())
+        a = int(np.bitwise_count(self.failing_bits[self.method_ids[node]] & ~successor_bits).sum())
+        return a, b
+
+    def failure_probability(self, node, successors):
+        """
+        :return: a / b, 0.0 for nodes outside the coverage or with b = 0.
+        """
+        if node not in self.method_ids:
+            return 0.0
+        a, b = self.terms(node, successors)
+        return a / b if b != 0 else 0.0
+
+    def failure_probabilities(self, pdg):
+        """
+        failure_probability of every PDG node with sparse products and element-wise
+        operations only. With S the (nodes x methods) successor matrix and F the
+        (methods x failing tests) coverage, S @ F is non-zero where a successor covers
+        a failing test, so per node
+            b = total tests - non-zeros of its S @ F row
+            a = non-zeros of its own F row - non-zeros of (own F row * S @ F row)
+        :param pdg: NetworkX DiGraph whose nodes are method names.
+        :return: Dictionary node -> probability, the values failure_probability gives.
+        """
+        nodes = pd.Index(list(pdg.nodes))
+        node_rows = self.lines.get_indexer(nodes)
+        known = node_rows >= 0
+
+        edges = np.array(list(pdg.edges), dtype=object).reshape(-1, 2)
+        sources = nodes.get_indexer(edges[:, 0])
+        targets = self.lines.get_indexer(edges[:, 1])
+        covered_edge = targets >= 0
+        successors = sp.csr_matrix(
+            (np.ones(np.count_nonzero(covered_edge), dtype=np.int32), (sources[covered_edge], targets[covered_edge])),
+            shape=(len(nodes), len(self.lines)),
+        )
+
+        on_successors = successors @ self.failing
+        own = self.failing[np.where(known, node_rows, 0)]
+        b = self.total_test - _row_counts(on_successors)
+        a = _row_counts(own) - _row_counts(own.multiply(on_successors))
+
+        probabilities = np.zeros(len(nodes))
+        np.divide(a, b, out=probabilities, where=known & (b != 0))
+        return dict(zip(nodes, probabilities.tolist()))
+
+
+def _row_counts(matrix):
+    """Non-zero entries per row of a sparse matrix."""
+    matrix = sp.csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    return np.diff(matrix.indptr)
@@ -0,0 +1,123 @@
+import numpy as np
+from ground_truth import load_ground_truth
+from spectrum_arrays import BugSpectrum, load_spectrum_json
+
+
+class Corpus:
+    """
+    Every bug of a spectrum file in contiguous arrays. The methods of all bugs are
+    concatenated in bug order, bug i owning rows offsets[i]:offsets[i+1] of the
+    methods, e_p, n_p, e_f, n_f and p columns. buggy_indices are positions inside
+    the bug's own rows, as in the ground truth index.
+    """
+    def __init__(self, bug_ids, offsets, methods, e_p, n_p, e_f, n_f, p, buggy_indices, failing_tests):
+        self.bug_ids = list(bug_ids)
+        self.offsets = offsets
+        self.methods = methods
+        self.e_p = e_p
+        self.n_p = n_p
+        self.e_f = e_f
+        self.n_f = n_f
+        self.p = p
+        self._buggy_indices = buggy_indices
+        self._failing_tests = failing_tests
+        self._positions = {bug_id: i for i, bug_id in enumerate(self.bug_ids)}
+        self._views = {}
+
+    @classmethod
+    def from_spectra(cls, spectra, ground_truth, bug_ids=None):
+        """
+        :param spectra: Dictionary bug_id -> BugSpectrum.
+        :param ground_truth: Output of ground_truth.load_ground_truth().
+        :param bug_ids: Bugs to keep, in order. Defaults to every bug of spectra that
+                        has a ground truth entry.
+        """
+        if bug_ids is None:
+            bug_ids = [bug_id for bug_id in spectra if bug_id in ground_truth]
+        bugs = [spectra[bug_id] for bug_id in bug_ids]
+
+        offsets = np.zeros(len(bugs) + 1, dtype=np.int64)
+        np.cumsum([len(spectrum) for spectrum in bugs], out=offsets[1:])
+
+        def concat(column, dtype):
+            if not bugs:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate([getattr(spectrum, column) for spectrum in bugs]).astype(dtype, copy=False)
+
+        return cls(
+            bug_ids, offsets, concat("methods", object),
+            concat("e_p", np.int32), concat("n_p", np.int32), concat("e_f", np.int32), concat("n_f", np.int32),
+            concat("p", np.float64),
+            [np.asarray(ground_truth[bug_id]["buggy_indices"], dtype=np.intp) for bug_id in bug_ids],
+            [ground_truth[bug_id]["failing_tests"] for bug_id in bug_ids],
+        )
+
+    @classmethod
+    def load(cls, spectrum_file="./new_spectrum.json", data_dir="./bug_data", bug_ids=None):
+        """
+        Loads a spectrum JSON file and its ground truth once.
+        """
+        return cls.from_spectra(load_spectrum_json(spectrum_file), load_ground_truth(spectrum_file, data_dir), bug_ids)
+
+    def __len__(self):
+        return len(self.bug_ids)
+
+    def __contains__(self, bug_id):
+        return bug_id in self._positions
+
+    def __iter__(self):
+        return iter(self.bug_ids)
+
+    def bug_slice(self, bug_id):
+        """
+        :return: Rows of the bug in the corpus columns.
+        """
+        i = self._positions[bug_id]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def spectrum(self, bug_id):
+        """
+        :return: BugSpectrum of one bug. Its columns are views, not copies.
+        """
+        if bug_id not in self._views:
+            rows = self.bug_slice(bug_id)
+            self._views[bug_id] = BugSpectrum(
+                bug_id, self.methods[rows], self.e_p[rows], self.n_p[rows], self.e_f[rows], self.n_f[rows], self.p[rows]
+            )
+        return self._views[bug_id]
+
+    def buggy_indices(self, bug_id):
+        return self._buggy_indices[self._positions[bug_id]]
+
+    def failing_tests(self, bug_id):
+        return self._failing_tests[self._positions[bug_id]]
+
+    def num_methods(self, bug_id):
+        i = self._positions[bug_id]
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def columns(self):
+        """
+        :return: Dictionary column name -> array over every method of every bug.
+        """
+        return {"e_p": self.e_p, "n_p": self.n_p, "e_f": self.e_f, "n_f": self.n_f, "p": self.p}
+
+    def split(self, values):
+        """
+        Splits a corpus wide per-method array (e.g. the scores of a formula) into
+        one view per bug.
+        :return: Dictionary bug_id -> array.
+        """
+        return {bug_id: values[self.bug_slice(bug_id)] for bug_id in self.bug_ids}
+
+    def subset(self, bug_ids):
+        """
+        :return: New Corpus with only the given bugs, in the given order.
+        """
+        bug_ids = list(bug_ids)
+        spectra = {bug_id: self.spectrum(bug_id) for bug_id in bug_ids}
+        ground_truth = {
+            bug_id: {"buggy_indices": self.buggy_indices(bug_id), "failing_tests": self.failing_tests(bug_id)}
+            for bug_id in bug_ids
+        }
+        return Corpus.from_spectra(spectra, ground_truth, bug_ids)
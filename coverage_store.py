@@ -0,0 +1,232 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from tqdm import tqdm
+
+STORE_DIR = "./coverage_store"
+WORD_BITS = 64
+
+
+class CoverageStore:
+    """
+    Line x test coverage matrix with every line's test vector packed into uint64 words.
+    Bit j of a row lives in word j // 64 at position j % 64 (little endian).
+    """
+    def __init__(self, lines, tests, bits, source_hash=None, source_stat=None):
+        self.lines = lines
+        self.tests = tests
+        self.bits = bits
+        # SHA-256 and [size, mtime_ns] of the pickle the store was built from
+        self.source_hash = source_hash
+        self.source_stat = source_stat
+
+    @property
+    def shape(self):
+        return len(self.lines), len(self.tests)
+
+    def to_dense(self):
+        """
+        Unpacks the bit matrix.
+        :return: Boolean NumPy array of shape (lines, tests).
+        """
+        as_bytes = self.bits.view(np.uint8).reshape(len(self.lines), -1)
+        unpacked = np.unpackbits(as_bytes, axis=1, count=len(self.tests), bitorder="little")
+        return unpacked.view(bool)
+
+    def to_sparse(self):
+        """
+        Expands only the non-zero words, so memory scales with covered entries.
+        :return: scipy CSR boolean matrix of shape (lines, tests).
+        """
+        rows, words = np.nonzero(self.bits)
+        word_bits = np.unpackbits(
+            np.ascontiguousarray(self.bits[rows, words]).view(np.uint8).reshape(-1, 8),
+            axis=1, bitorder="little",
+        )
+        hit, bit = np.nonzero(word_bits)
+        return sp.csr_matrix(
+            (np.ones(len(hit), dtype=bool), (rows[hit], words[hit] * WORD_BITS + bit)),
+            shape=self.shape,
+        )
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stat(file_path):
+    """
+    :return: [size, mtime in ns] of a file, as recorded in the store metadata.
+    """
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def source_hash(file_path, store=None):
+    """
+    SHA-256 of a store's source file. The file is only read when its size or mtime
+    differ from the ones recorded with the store's source_hash.
+    :return: (SHA-256, file_stat) of the file.
+    """
+    stat = file_stat(file_path)
+    if store is not None and store.source_hash is not None and store.source_stat == stat:
+        return store.source_hash, stat
+    return file_hash(file_path), stat
+
+
+def pack_bits(matrix):
+    """
+    Packs a boolean (rows, columns) matrix into (rows, ceil(columns / 64)) uint64 words.
+    """
+    matrix = np.asarray(matrix, dtype=bool)
+    n_rows, n_cols = matrix.shape
+    n_words = max(1, -(-n_cols // WORD_BITS))
+    packed = np.zeros((n_rows, n_words * 8), dtype=np.uint8)
+    packed[:, :-(-n_cols // 8)] = np.packbits(matrix, axis=1, bitorder="little")
+    return packed.view("<u8")
+
+
+def pack_sparse(matrix):
+    """
+    Packs a scipy sparse boolean matrix without densifying it.
+    """
+    coo = sp.coo_matrix(matrix)
+    mask = coo.data != 0
+    rows, cols = coo.row[mask], coo.col[mask]
+    packed = np.zeros((coo.shape[0], max(1, -(-coo.shape[1] // WORD_BITS))), dtype="<u8")
+    np.bitwise_or.at(packed, (rows, cols // WORD_BITS), np.left_shift(np.uint64(1), (cols % WORD_BITS).astype(np.uint64)))
+    return packed
+
+
+def pack_coverage(coverage_df):
+    """
+    Converts a line x test coverage DataFrame into a CoverageStore.
+    :param coverage_df: DataFrame indexed by line id with one column per test.
+    :return: CoverageStore
+    """
+    return CoverageStore(
+        [str(line) for line in coverage_df.index],
+        [str(test) for test in coverage_df.columns],
+        pack_bits(coverage_df.to_numpy(dtype=bool)),
+    )
+
+
+def store_paths(bug_id, store_dir=STORE_DIR):
+    return (
+        os.path.join(store_dir, f"{bug_id}.bits.npy"),
+        os.path.join(store_dir, f"{bug_id}.ids.json"),
+    )
+
+
+def save_coverage_store(store, bug_id, store_dir=STORE_DIR):
+    """
+    Writes both files to temporary files first, so an interrupted run never leaves a
+    half written store. The ids file, which holds the source hash, is replaced last.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    bits_path, ids_path = store_paths(bug_id, store_dir)
+    with open(bits_path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(store.bits))
+    os.replace(bits_path + ".tmp", bits_path)
+    save_store_ids(store, bug_id, store_dir)
+
+
+def save_store_ids(store, bug_id, store_dir=STORE_DIR):
+    """
+    Rewrites only the ids file, e.g. to record a new mtime of an unchanged source.
+    """
+    ids_path = store_paths(bug_id, store_dir)[1]
+    with open(ids_path + ".tmp", "w") as f:
+        json.dump({
+            "lines": store.lines, "tests": store.tests,
+            "source_hash": store.source_hash, "source_stat": store.source_stat,
+        }, f)
+    os.replace(ids_path + ".tmp", ids_path)
+
+
+def load_coverage_store(bug_id, store_dir=STORE_DIR, mmap=True):
+    """
+    Loads a packed coverage store. With mmap the bit matrix is memory-mapped, not read.
+    """
+    bits_path, ids_path = store_paths(bug_id, store_dir)
+    with open(ids_path, "r") as f:
+        ids = json.load(f)
+    bits = np.load(bits_path, mmap_mode="r" if mmap else None)
+    return CoverageStore(ids["lines"], ids["tests"], bits, ids.get("source_hash"), ids.get("source_stat"))
+
+
+def convert_pickle(bug_id, data_dir="./bug_data", store_dir=STORE_DIR, pickle_hash=None):
+    """
+    Converts `{data_dir}/{bug_id}-cov.pkl` into the packed store format. The SHA-256
+    of the pickle is recorded as the store's source_hash.
+    :param pickle_hash: SHA-256 of the pickle if the caller already has it.
+    """
+    pickle_path = os.path.join(data_dir, f"{bug_id}-cov.pkl")
+    stat = file_stat(pickle_path)
+    store = pack_coverage(pd.read_pickle(pickle_path))
+    store.source_hash = pickle_hash or file_hash(pickle_path)
+    store.source_stat = stat
+    save_coverage_store(store, bug_id, store_dir)
+    return store
+
+
+def load_coverage(bug_id, data_dir="./bug_data", store_dir=STORE_DIR, pickle_hash=None):
+    """
+    Returns the packed coverage of a bug, converting its pickle first if the store is
+    missing, does not match its ids file, or was built from another pickle content.
+    The pickle is only hashed when its size or mtime changed since the store was
+    built. Without the pickle an existing store is used as is.
+    :param pickle_hash: SHA-256 of the pickle if the caller already has it.
+    """
+    pickle_path = os.path.join(data_dir, f"{bug_id}-cov.pkl")
+    if not os.path.exists(pickle_path):
+        return load_coverage_store(bug_id, store_dir)
+
+    store = load_valid_store(bug_id, store_dir)
+    if pickle_hash is None:
+        pickle_hash, stat = source_hash(pickle_path, store)
+    else:
+        stat = file_stat(pickle_path)
+    if store is not None and store.source_hash == pickle_hash:
+        if store.source_stat != stat:
+            store.source_stat = stat
+            save_store_ids(store, bug_id, store_dir)
+        return store
+    convert_pickle(bug_id, data_dir, store_dir, pickle_hash)
+    return load_coverage_store(bug_id, store_dir)
+
+
+def load_valid_store(bug_id, store_dir=STORE_DIR):
+    """
+    :return: The stored CoverageStore, None if it is missing, unreadable or its bit
+             matrix does not have the shape its ids file gives.
+    """
+    if not all(os.path.exists(path) for path in store_paths(bug_id, store_dir)):
+        return None
+    try:
+        store = load_coverage_store(bug_id, store_dir)
+    except (ValueError, EOFError, OSError, KeyError):
+        return None
+    if store.bits.shape != (len(store.lines), max(1, -(-len(store.tests) // WORD_BITS))):
+        return None
+    return store
+
+
+if __name__ == "__main__":
+    all_bugs = [
+        fname[:-len("-cov.pkl")]
+        for fname in sorted(os.listdir("./bug_data"))
+        if fname.endswith("-cov.pkl")
+    ]
+    for bug_id in tqdm(all_bugs):
+        convert_pickle(bug_id)
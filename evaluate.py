@@ -1,108 +1,73 @@
-import os, json
-import math
-
-def safe_divide(a, b):
-    return a / b if b != 0 else 0
-
-def evaluate_formula(formula):
-    method_level_spectrum_with_p_file = './new_spectrum.json'
-    with open(method_level_spectrum_with_p_file, 'r') as f:
-        spectrum_with_p = json.load(f)
-    
-    acc1 = 0
-    acc3 = 0
-    acc5 = 0
-    acc10 = 0
-    wefs = []
-
-    all_bugs = [file.split('_')[0] for file in os.listdir('sootDAG_filtered')]
+import os, argparse
+from formula import score_spectrum
+from ground_truth import load_ground_truth
+from ranking import best_rank, TIE_POLICIES
+from spectrum_arrays import load_spectrum_json
+
+def load_evaluation_data(spectrum_file='./new_spectrum.json', dag_folder='sootDAG_filtered', data_dir='./bug_data'):
+    """
+    Loads everything the evaluation needs in one pass.
+    :return: List of (bug_id, BugSpectrum, buggy method positions) for every bug with a filtered DAG.
+    :raises ValueError: A bug has no ground truth or none of its buggy methods is in its spectrum.
+    """
+    spectrum_with_p = load_spectrum_json(spectrum_file)
+    ground_truth = load_ground_truth(spectrum_file, data_dir)
+
+    all_bugs = [file.split('_')[0] for file in os.listdir(dag_folder)]
     for bug in all_bugs:
-        with open(f"./bug_data/{bug}.json", 'r') as f:
-            bug_info = json.load(f)
-        
-        spectrum = spectrum_with_p[bug]
-        sbfl_scores = {}
-        buggy_methods = [buggy_lines.split(':')[0] for buggy_lines in bug_info["buggy_lines"]]
-        for method, spectra in spectrum.items():
-            sbfl_scores[method] = eval(str(formula), {"safe_divide": safe_divide, "math": math}, spectra)
-
-            
-        sorted_sbfl_scores = sorted(sbfl_scores.items(), key=lambda x: x[1], reverse=True)
-        ranks = {method: rank+1 for rank, (method, _) in enumerate(sorted_sbfl_scores)}
-        buggy_methods_ranks = [ranks[buggy_method] for buggy_method in buggy_methods]
-        ranking = min(buggy_methods_ranks)        
-        # print(ranking)
-
-        if ranking == 1:
-            acc1 += 1
-            acc3 += 1
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 3:
-            acc3 += 1
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 5:
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 10:
-            acc10 += 1
-        wefs.append(ranking)
-    
-    return acc1, acc3, acc5, acc10, sum(wefs) / len(wefs)
-
-def evaluate_weighted_formula(formula):
-    method_level_spectrum_with_p_file = './new_spectrum.json'
-
-    
-    with open(method_level_spectrum_with_p_file, 'r') as f:
-        spectrum_with_p = json.load(f)
-
-
-    
-    acc1 = 0
-    acc3 = 0
-    acc5 = 0
-    acc10 = 0
-    wefs = []
-
-    all_bugs = [file.split('_')[0] for file in os.listdir('sootDAG_filtered')]
-    for bug in all_bugs:
-        with open(f"./bug_data/{bug}.json", 'r') as f:
-            bug_info = json.load(f)
-        
-        spectrum = spectrum_with_p[bug]
-        weighted_sbfl_scores = {}
-        buggy_methods = [buggy_lines.split(':')[0] for buggy_lines in bug_info["buggy_lines"]]
-        for method, spectra in spectrum.items():
-            sbfl_score = eval(str(formula), {"safe_divide": safe_divide, "math": math}, spectra)
-            weight = spectra["p"]
-            weighted_sbfl_scores[method] = sbfl_score*(1-weight*0.7)
-
-            
-        sorted_sbfl_scores = sorted(weighted_sbfl_scores.items(), key=lambda x: x[1], reverse=True)
-        ranks = {method: rank+1 for rank, (method, _) in enumerate(sorted_sbfl_scores)}
-        buggy_methods_ranks = [ranks[buggy_method] for buggy_method in buggy_methods]
-        ranking = min(buggy_methods_ranks)        
-        # print(ranking)
-
-        if ranking == 1:
-            acc1 += 1
-            acc3 += 1
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 3:
-            acc3 += 1
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 5:
-            acc5 += 1
-            acc10 += 1
-        elif ranking <= 10:
-            acc10 += 1
-        wefs.append(ranking)
-    
-    return acc1, acc3, acc5, acc10, sum(wefs) / len(wefs)
+        if bug not in ground_truth:
+            raise ValueError(f"{bug} has no bug info in {data_dir}")
+        if not ground_truth[bug]["buggy_indices"]:
+            raise ValueError(f"{bug} has no buggy method in {spectrum_file}, it cannot be ranked")
+    return [(bug, spectrum_with_p[bug], ground_truth[bug]["buggy_indices"]) for bug in all_bugs]
+
+def bayesian_weight(spectrum):
+    return 1 - spectrum.p*0.7
+
+def summarize_rankings(rankings):
+    """
+    :return: acc@1, acc@3, acc@5, acc@10, wef
+    """
+    acc1 = sum(1 for ranking in rankings if ranking <= 1)
+    acc3 = sum(1 for ranking in rankings if ranking <= 3)
+    acc5 = sum(1 for ranking in rankings if ranking <= 5)
+    acc10 = sum(1 for ranking in rankings if ranking <= 10)
+    return acc1, acc3, acc5, acc10, sum(rankings) / len(rankings)
+
+def evaluate_formulas(formulas, weightings=None, data=None, ties="stable"):
+    """
+    Evaluates many formulas in one scan over the corpus. Every formula is scored once
+    per bug and reused by all weighting schemes.
+    :param formulas: List of (name, formula) pairs.
+    :param weightings: Dictionary scheme name -> function(BugSpectrum) returning the
+                       per-method weight, or None for the plain scores.
+                       Defaults to {"baseline": None}.
+    :param data: Output of load_evaluation_data(), loaded here when not given.
+    :param ties: Tie policy of the ranking, see ranking.TIE_POLICIES.
+    :return: Dictionary (scheme name, formula name) -> (acc@1, acc@3, acc@5, acc@10, wef).
+    """
+    if weightings is None:
+        weightings = {"baseline": None}
+    if data is None:
+        data = load_evaluation_data()
+
+    rankings = {(scheme, name): [] for scheme in weightings for name, _ in formulas}
+    for bug, spectrum, buggy_indices in data:
+        weights = {scheme: weighting(spectrum) for scheme, weighting in weightings.items() if weighting is not None}
+        for name, formula in formulas:
+            # 버그 하나의 모든 메소드를 한 번에 계산
+            sbfl_scores = score_spectrum(formula, spectrum)
+            for scheme in weightings:
+                scores = sbfl_scores*weights[scheme] if scheme in weights else sbfl_scores
+                rankings[(scheme, name)].append(best_rank(scores, buggy_indices, ties))
+
+    return {key: summarize_rankings(ranking) for key, ranking in rankings.items()}
+
+def evaluate_formula(formula, ties="stable"):
+    return evaluate_formulas([("formula", formula)], ties=ties)[("baseline", "formula")]
+
+def evaluate_weighted_formula(formula, ties="stable"):
+    return evaluate_formulas([("formula", formula)], {"weighted": bayesian_weight}, ties=ties)[("weighted", "formula")]
 
 
 trantula = "safe_divide(safe_divide(e_f, (e_f+n_f)), (safe_divide(e_f, (e_f+n_f))+safe_divide(e_p, (e_p+n_p))))"
@@ -113,73 +78,50 @@ sunwoo = "safe_divide(math.sqrt(0.95 * safe_divide(e_p, e_p + n_p)), (0.5 * math
 donghan = "(((n_p * e_f) * e_f) - (n_p * (e_f - e_f)))"
 jihun = "(safe_divide(n_f, e_p) * safe_divide((e_p * e_f), e_p)) * e_f"
 
-trantula_acc1, trantula_acc3, trantula_acc5, trantula_acc10, trantula_wef = evaluate_formula(trantula)
-ochiai_acc1, ochiai_acc3, ochiai_acc5, ochiai_acc10, ochiai_wef = evaluate_formula(ochiai)
-jaccard_acc1, jaccard_acc3, jaccard_acc5, jaccard_acc10, jaccard_wef = evaluate_formula(jaccard)
-naryeong_acc1, naryeong_acc3, naryeong_acc5, naryeong_acc10, naryeong_wef = evaluate_formula(naryeong)
-sunwoo_acc1, sunwoo_acc3, sunwoo_acc5, sunwoo_acc10, sunwoo_wef = evaluate_formula(sunwoo)
-donghan_acc1, donghan_acc3, donghan_acc5, donghan_acc10, donghan_wef = evaluate_formula(donghan)
-jihun_acc1, jihun_acc3, jihun_acc5, jihun_acc10, jihun_wef = evaluate_formula(jihun)
-
-print(f"Total bugs: {len(os.listdir('sootDAG_filtered'))}")
-print("acc@1, acc@3, acc@5, acc@10, wef")
-print("--------------------------------------baseline----------------------------------------------")
-print("trantula")
-print(trantula_acc1, trantula_acc3, trantula_acc5, trantula_acc10, trantula_wef)
-print("ochiai")
-print(ochiai_acc1, ochiai_acc3, ochiai_acc5, ochiai_acc10, ochiai_wef)
-print("jaccard")
-print(jaccard_acc1, jaccard_acc3, jaccard_acc5, jaccard_acc10, jaccard_wef)
-print("naryeong")
-print(naryeong_acc1, naryeong_acc3, naryeong_acc5, naryeong_acc10, naryeong_wef)
-print("sunwoo")
-print(sunwoo_acc1, sunwoo_acc3, sunwoo_acc5, sunwoo_acc10, sunwoo_wef)
-print("donghan")
-print(donghan_acc1, donghan_acc3, donghan_acc5, donghan_acc10, donghan_wef)
-print("jihun")
-print(jihun_acc1, jihun_acc3, jihun_acc5, jihun_acc10, jihun_wef)
-print("-----------------Our Approach--------------------------------------")
-
-weighted_trantula_acc1, weighted_trantula_acc3, weighted_trantula_acc5, weighted_trantula_acc10, weighted_trantula_wef = evaluate_weighted_formula(trantula)
-weighted_ochiai_acc1, weighted_ochiai_acc3, weighted_ochiai_acc5, weighted_ochiai_acc10, weighted_ochiai_wef = evaluate_weighted_formula(ochiai)
-weighted_jaccard_acc1, weighted_jaccard_acc3, weighted_jaccard_acc5, weighted_jaccard_acc10, weighted_jaccard_wef = evaluate_weighted_formula(jaccard)
-weighted_naryeong_acc1, weighted_naryeong_acc3, weighted_naryeong_acc5, weighted_naryeong_acc10, weighted_naryeong_wef = evaluate_weighted_formula(naryeong)
-weighted_sunwoo_acc1, weighted_sunwoo_acc3, weighted_sunwoo_acc5, weighted_sunwoo_acc10, weighted_sunwoo_wef = evaluate_weighted_formula(sunwoo)
-weighted_donghan_acc1, weighted_donghan_acc3, weighted_donghan_acc5, weighted_donghan_acc10, weighted_donghan_wef = evaluate_weighted_formula(donghan)
-weighted_jihun_acc1, weighted_jihun_acc3, weighted_jihun_acc5, weighted_jihun_acc10, weighted_jihun_wef = evaluate_weighted_formula(jihun)
-print("trantula")
-print(weighted_trantula_acc1, weighted_trantula_acc3, weighted_trantula_acc5, weighted_trantula_acc10, weighted_trantula_wef)
-print("ochiai")
-print(weighted_ochiai_acc1, weighted_ochiai_acc3, weighted_ochiai_acc5, weighted_ochiai_acc10, weighted_ochiai_wef)
-print("jaccard")
-print(weighted_jaccard_acc1, weighted_jaccard_acc3, weighted_jaccard_acc5, weighted_jaccard_acc10, weighted_jaccard_wef)
-print("naryeong")
-print(weighted_naryeong_acc1, weighted_naryeong_acc3, weighted_naryeong_acc5, weighted_naryeong_acc10, weighted_naryeong_wef)
-print("sunsoo")
-print(weighted_sunwoo_acc1, weighted_sunwoo_acc3, weighted_sunwoo_acc5, weighted_sunwoo_acc10, weighted_sunwoo_wef)
-print("donghan")
-print(weighted_donghan_acc1, weighted_donghan_acc3, weighted_donghan_acc5, weighted_donghan_acc10, weighted_donghan_wef)
-print("jihun")
-print(weighted_jihun_acc1, weighted_jihun_acc3, weighted_jihun_acc5, weighted_jihun_acc10, weighted_jihun_wef)
-
-
 bayesian_nr = "(p + ((e_f * n_p) * n_p))"
 bayesian_sw = "((math.sqrt((0.0 if (e_f + n_f) == 0 else safe_divide(e_f, (e_f + n_f)) + p)) - ((0.0 if (e_p + n_p) == 0 else safe_divide(e_p, (e_p + n_p)) + p) + math.sqrt(0.0 if (e_p + n_p) == 0 else safe_divide(e_p, (e_p + n_p))))) + ((0.82 - (0.76 * p)) * 0.0 if (e_f + n_f) == 0 else safe_divide(e_f, (e_f + n_f))))"
 bayesian_dh = "((e_p * e_f) - (n_p * (((p - 1) * e_f) - (2 * e_f))))"
 bayesian_jh = "((safe_divide(e_f, (safe_divide((e_f * (e_p + safe_divide(e_p, (n_f * p)))), p) + safe_divide(e_f, e_p))) + safe_divide(e_p, n_p)) * safe_divide(e_f, e_p))"
 
-bnr_acc1, bnr_acc3, bnr_acc5, bnr_acc10, bnr_wef = evaluate_formula(bayesian_nr)
-bsw_acc1, bsw_acc3, bsw_acc5, bsw_acc10, bsw_wef = evaluate_formula(bayesian_sw)
-bdh_acc1, bdh_acc3, bdh_acc5, bdh_acc10, bdh_wef = evaluate_formula(bayesian_dh)
-bjh_acc1, bjh_acc3, bjh_acc5, bjh_acc10, bjh_wef = evaluate_formula(bayesian_jh)
-
-print("----------------------------------GP version-----------------------------------------")
-print("Naryeong")
-print(bnr_acc1, bnr_acc3, bnr_acc5, bnr_acc10, bnr_wef)
-print("Sunwoo")
-print(bsw_acc1, bsw_acc3, bsw_acc5, bsw_acc10, bsw_wef)
-print("donghan")
-print(bdh_acc1, bdh_acc3, bdh_acc5, bdh_acc10, bdh_wef)
-print("jihun")
-print(bjh_acc1, bjh_acc3, bjh_acc5, bjh_acc10, bjh_wef)
-
+BASELINE_FORMULAS = [
+    ("trantula", trantula),
+    ("ochiai", ochiai),
+    ("jaccard", jaccard),
+    ("naryeong", naryeong),
+    ("sunwoo", sunwoo),
+    ("donghan", donghan),
+    ("jihun", jihun),
+]
+
+GP_FORMULAS = [
+    ("Naryeong", bayesian_nr),
+    ("Sunwoo", bayesian_sw),
+    ("donghan", bayesian_dh),
+    ("jihun", bayesian_jh),
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ties", choices=TIE_POLICIES, default="stable", help="how tied scores are ranked")
+    args = parser.parse_args()
+
+    data = load_evaluation_data()
+    baseline_results = evaluate_formulas(BASELINE_FORMULAS, {"baseline": None, "weighted": bayesian_weight}, data, args.ties)
+    gp_results = evaluate_formulas(GP_FORMULAS, {"baseline": None}, data, args.ties)
+
+    print(f"Total bugs: {len(os.listdir('sootDAG_filtered'))}")
+    print("acc@1, acc@3, acc@5, acc@10, wef")
+    print("--------------------------------------baseline----------------------------------------------")
+    for name, _ in BASELINE_FORMULAS:
+        print(name)
+        print(*baseline_results[("baseline", name)])
+    print("-----------------Our Approach--------------------------------------")
+    for name, _ in BASELINE_FORMULAS:
+        print(name)
+        print(*baseline_results[("weighted", name)])
+
+    print("----------------------------------GP version-----------------------------------------")
+    for name, _ in GP_FORMULAS:
+        print(name)
+        print(*gp_results[("baseline", name)])
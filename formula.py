@@ -0,0 +1,153 @@
+import ast
+import functools
+import numpy as np
+
+
+def safe_divide(a, b, default=0.0):
+    """
+    Vectorized version of `a / b if b != 0 else default`.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b != 0, a / b, default)
+
+
+def _if_else(condition, body, orelse):
+    return np.where(condition, body, orelse)
+
+
+def _compare(left, ops, comparators):
+    # Chained comparisons (a < b < c) are the logical and of every pair
+    result = None
+    for op, right in zip(ops, comparators):
+        current = op(left, right)
+        result = current if result is None else np.logical_and(result, current)
+        left = right
+    return result
+
+
+FUNCTIONS = {
+    "safe_divide": safe_divide,
+    "math.sqrt": np.sqrt,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+}
+
+COMPARE_OPS = {
+    ast.Eq: "_eq", ast.NotEq: "_ne", ast.Lt: "_lt", ast.LtE: "_le", ast.Gt: "_gt", ast.GtE: "_ge",
+}
+
+NAMESPACE = {
+    "_where": _if_else,
+    "_float": np.float64,
+    "_compare": _compare,
+    "_and": np.logical_and,
+    "_or": np.logical_or,
+    "_not": np.logical_not,
+    "_eq": np.equal,
+    "_ne": np.not_equal,
+    "_lt": np.less,
+    "_le": np.less_equal,
+    "_gt": np.greater,
+    "_ge": np.greater_equal,
+}
+NAMESPACE.update({f"_fn_{i}": fn for i, fn in enumerate(FUNCTIONS.values())})
+FUNCTION_NAMES = {name: f"_fn_{i}" for i, name in enumerate(FUNCTIONS)}
+
+
+def _call(name, args, like):
+    return ast.copy_location(ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[]), like)
+
+
+class _Vectorizer(ast.NodeTransformer):
+    """
+    Rewrites a scalar formula AST into NumPy calls: `a if c else b` -> np.where,
+    comparisons and boolean operators -> element-wise functions, known calls -> NumPy.
+    Anything else (attribute access, subscripts, lambdas, ...) is rejected.
+    """
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        return self.generic_visit(node)
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return _call("_not", [self.visit(node.operand)], node)
+        if not isinstance(node.op, (ast.USub, ast.UAdd)):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        return self.generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        name = "_and" if isinstance(node.op, ast.And) else "_or"
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = _call(name, [result, value], node)
+        return result
+
+    def visit_Compare(self, node):
+        ops = [ast.Name(id=COMPARE_OPS[type(op)], ctx=ast.Load()) for op in node.ops]
+        return _call("_compare", [
+            self.visit(node.left),
+            ast.List(elts=ops, ctx=ast.Load()),
+            ast.List(elts=[self.visit(c) for c in node.comparators], ctx=ast.Load()),
+        ], node)
+
+    def visit_IfExp(self, node):
+        return _call("_where", [self.visit(node.test), self.visit(node.body), self.visit(node.orelse)], node)
+
+    def visit_Call(self, node):
+        name = ast.unparse(node.func)
+        if name not in FUNCTION_NAMES or node.keywords:
+            raise ValueError(f"Unsupported function: {name}")
+        return _call(FUNCTION_NAMES[name], [self.visit(arg) for arg in node.args], node)
+
+    def visit_Name(self, node):
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+        # Both branches of np.where are evaluated, so constants must be NumPy floats:
+        # `1 if (1 - 1) == 0 else 1/(1 - 1)` would otherwise raise ZeroDivisionError
+        return _call("_float", [node], node)
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.BinOp, ast.UnaryOp, ast.operator, ast.unaryop, ast.Load)):
+            raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+        return super().generic_visit(node)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_formula(formula):
+    """
+    Parses a formula string once and compiles it into a vectorized function.
+    The formula may use safe_divide, math.sqrt, `a if c else b`, comparisons and
+    arithmetic over any variable names (e_p, n_p, e_f, n_f, p, ...).
+    :return: Function taking the variables as keyword arrays and returning a float64 array.
+    """
+    tree = _Vectorizer().visit(ast.parse(str(formula).strip(), mode="eval"))
+    code = compile(ast.fix_missing_locations(tree), f"<formula {formula}>", "eval")
+
+    def evaluate(**columns):
+        size = len(next(iter(columns.values()))) if columns else 1
+        variables = {name: np.asarray(column, dtype=np.float64) for name, column in columns.items()}
+        with np.errstate(all="ignore"):
+            scores = eval(code, NAMESPACE, variables)
+        return np.broadcast_to(np.asarray(scores, dtype=np.float64), (size,))
+
+    return evaluate
+
+
+def score_spectrum(formula, spectrum):
+    """
+    Scores every method of a bug in one call.
+    :param spectrum: BugSpectrum
+    :return: float64 array with one score per method.
+    """
+    return compile_formula(formula)(**spectrum.columns())
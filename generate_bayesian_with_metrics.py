@@ -3,6 +3,7 @@ import os
 import math
 import networkx as nx
 import tqdm
+from spectrum_store import INDEX_FILE, iter_spectra
 
 def load_bayesian_network(file_path):
     """
@@ -83,27 +84,20 @@ def calculate_metrics(data):
         "jihun": suspiciousness_jihun,
     }
 
-def add_metrics_to_spectrum_separately(input_file, output_dir, bayesian_networks_folder):
+def add_metrics_to_spectrum_separately(input_dir, output_dir, bayesian_networks_folder):
     """
-    Reads the spectrum JSON file, calculates metrics for each method, 
+    Streams the sharded spectrum store one bug at a time, calculates metrics for each method, 
     and saves each metric to separate JSON files.
-    :param input_file: Path to the input method level spectrum JSON file.
+    :param input_dir: Directory of the sharded method level spectrum store.
     :param output_dir: Directory to save the updated JSON files for each metric.
     """
-    if not os.path.exists(input_file):
-        print(f"Input file '{input_file}' does not exist.")
+    if not os.path.exists(os.path.join(input_dir, INDEX_FILE)):
+        print(f"Spectrum store '{input_dir}' does not exist.")
         return
 
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
 
-    with open(input_file, 'r') as file:
-        try:
-            spectrum_data = json.load(file)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {e}")
-            return
-
     # Initialize dictionaries for each metric
     metrics_data = {
         "tarantula": {},
@@ -120,7 +114,7 @@ def add_metrics_to_spectrum_separately(input_file, output_dir, bayesian_networks
 
 
     # Iterate over each chart and its methods
-    for chart, methods in spectrum_data.items():
+    for chart, methods in iter_spectra(input_dir):
         file_name = f"{chart}_bayesian_network.dot"
         bn_file_path = os.path.join(bayesian_networks_folder, file_name)
         # bn = load_bayesian_network(bn_file_path)
@@ -189,8 +183,8 @@ def add_metrics_to_spectrum_separately(input_file, output_dir, bayesian_networks
         print(f"{metric.capitalize()} metrics saved to {file_path}")
 
 # File paths
-input_file = './method_level_spectrums.json'
+input_dir = './method_level_spectrums'
 output_dir = './metric_value_json_output'  # Directory to store individual metric files
 bayesian_networks_folder = './bayesian_networks'
 # Add metrics to the spectrum data and save to separate files
-add_metrics_to_spectrum_separately(input_file, output_dir, bayesian_networks_folder)
\ No newline at end of file
+add_metrics_to_spectrum_separately(input_dir, output_dir, bayesian_networks_folder)
\ No newline at end of file
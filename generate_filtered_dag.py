@@ -1,8 +1,8 @@
 import os
-import json
 import networkx as nx
 import re
 import matplotlib.pyplot as plt
+from spectrum_store import iter_spectra
 
 def parse_node_format(node):
     """
@@ -112,11 +112,7 @@ def save_dag_to_dot(dag, output_file):
 
 input_folder = './sootOutput'
 output_folder = './sootDAG_filtered'
-spectrum_file = './method_level_spectrums.json'
-
-# Load method level spectrums
-with open(spectrum_file, 'r') as file:
-    spectrum_data = json.load(file)
+spectrum_dir = './method_level_spectrums'
 
 # Ensure the output folder exists
 os.makedirs(output_folder, exist_ok=True)
@@ -124,7 +120,8 @@ os.makedirs(output_folder, exist_ok=True)
 # Get all files in the input folder as lowercase
 files_in_input_folder = {f.lower(): f for f in os.listdir(input_folder)}
 
-for project, methods in spectrum_data.items():
+# Method level spectrums are streamed one bug at a time
+for project, methods in iter_spectra(spectrum_dir):
     pid, vid = project.split("-")
     expected_file_name = f"{pid}{vid}_dependency_graph.dot".lower()
     output_file_name = f"{project}_dependency_graph.dot"
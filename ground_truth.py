@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+from coverage_store import file_hash
+
+
+def truth_path(spectrum_file):
+    """
+    The index lives next to the spectrum file it was built from,
+    e.g. new_spectrum.json -> new_spectrum.truth.json
+    """
+    return os.path.splitext(spectrum_file)[0] + ".truth.json"
+
+
+def bug_info_path(bug_id, data_dir="./bug_data"):
+    return os.path.join(data_dir, f"{bug_id}.json")
+
+
+def bug_info_hashes(bug_ids, data_dir="./bug_data"):
+    """
+    :return: Dictionary bug_id -> SHA-256 of its bug info file, None for a missing file.
+    """
+    return {
+        bug_id: file_hash(bug_info_path(bug_id, data_dir)) if os.path.exists(bug_info_path(bug_id, data_dir)) else None
+        for bug_id in bug_ids
+    }
+
+
+def build_ground_truth(spectrum_file, data_dir="./bug_data", missing=None):
+    """
+    Builds the ground truth of every bug in a spectrum JSON file.
+    Buggy methods that are not in the bug's spectrum are left out, and so are bugs
+    without a bug info file.
+    :param missing: List the ids of the bugs without a bug info file are appended to.
+    :return: Dictionary bug_id -> {'buggy_indices': sorted positions of the buggy methods
+             in the bug's method order, 'failing_tests': failing test ids}.
+    :raises FileNotFoundError: No bug of the spectrum has a bug info file in data_dir.
+    """
+    with open(spectrum_file, "r") as f:
+        spectrum_data = json.load(f)
+
+    ground_truth = {}
+    for bug_id, spectrum in spectrum_data.items():
+        info_path = bug_info_path(bug_id, data_dir)
+        if not os.path.exists(info_path):
+            if missing is not None:
+                missing.append(bug_id)
+            continue
+        with open(info_path, "r") as f:
+            bug_info = json.load(f)
+
+        buggy_methods = set(buggy_line.split(":")[0] for buggy_line in bug_info["buggy_lines"])
+        ground_truth[bug_id] = {
+            "buggy_indices": [i for i, method in enumerate(spectrum) if method in buggy_methods],
+            "failing_tests": bug_info["failing_tests"],
+        }
+    if spectrum_data and not ground_truth:
+        raise FileNotFoundError(f"No bug of {spectrum_file} has a bug info file in {data_dir}")
+    return ground_truth
+
+
+def load_ground_truth(spectrum_file="./new_spectrum.json", data_dir="./bug_data"):
+    """
+    Loads the ground truth index of a spectrum file in one read. The index is
+    rebuilt when the content hash of the spectrum file, the bug info directory or
+    the content hash of one of its bug info files changed, or when a missing bug
+    info file appeared.
+    :return: See build_ground_truth.
+    """
+    source_hash = file_hash(spectrum_file)
+    data_dir_key = os.path.abspath(data_dir)
+    path = truth_path(spectrum_file)
+
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            cached = json.load(f)
+        if (
+            cached.get("source_hash") == source_hash
+            and cached.get("data_dir") == data_dir_key
+            and cached.get("bug_info") == bug_info_hashes(cached.get("bug_info", {}), data_dir)
+        ):
+            return cached["bugs"]
+
+    missing = []
+    ground_truth = build_ground_truth(spectrum_file, data_dir, missing)
+    with open(path + ".tmp", "w") as f:
+        json.dump({
+            "source_hash": source_hash,
+            "data_dir": data_dir_key,
+            "bug_info": bug_info_hashes(list(ground_truth) + missing, data_dir),
+            "bugs": ground_truth,
+        }, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+    return ground_truth
+
+
+if __name__ == "__main__":
+    # python ground_truth.py new_spectrum.json
+    load_ground_truth(*sys.argv[1:])
@@ -1,17 +1,24 @@
 import os
 import json
-import pandas as pd
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from tqdm import tqdm
-
-def get_spectrum(coverage_df, failing_tests):
-
-    X = coverage_df.values.transpose()
-
-    is_failing = np.array([test in failing_tests for test in coverage_df.columns])
-
-    e_p = X[~is_failing].sum(axis=0)
-    e_f = X[is_failing].sum(axis=0)
+from method_coverage import load_method_coverage
+from spectrum_store import SPECTRUM_DIR, has_spectrum, read_sources, write_index, write_spectrum
+
+def get_spectrum(coverage, tests, failing_tests):
+    """
+    Spectrum counts straight from a sparse (methods x tests) coverage matrix.
+    :param coverage: scipy CSR boolean matrix, one row per method.
+    :param tests: Test ids in column order.
+    :param failing_tests: Ids of the failing tests.
+    """
+    is_failing = np.array([test in failing_tests for test in tests])
+
+    e_f = coverage.astype(np.int32) @ is_failing.astype(np.int32)
+    e_p = np.diff(coverage.indptr) - e_f
     n_p = np.sum(~is_failing) - e_p
     n_f = np.sum(is_failing) - e_f
 
@@ -30,20 +37,16 @@ total_bugs = len(all_bugs)
 def make_spectrum_dict(bug_id):
 
     bug_info_path = os.path.join(f"./bug_data/{bug_id}.json") 
-    coverage_path = os.path.join(f"./bug_data/{bug_id}-cov.pkl")
 
     with open(bug_info_path, "r") as f:
         bug_info = json.load(f)
 
-    coverage = pd.read_pickle(coverage_path)
-    coverage.index = coverage.index.str.split(":").str[0]
-    
-    grouped_coverage = coverage.groupby(coverage.index).any()
+    grouped_coverage = load_method_coverage(bug_id)
 
-    e_p, n_p, e_f, n_f = get_spectrum(grouped_coverage, bug_info["failing_tests"])
+    e_p, n_p, e_f, n_f = get_spectrum(grouped_coverage.to_sparse(), grouped_coverage.tests, bug_info["failing_tests"])
 
     spectrum_dict = {}
-    for i, method in enumerate(grouped_coverage.index):
+    for i, method in enumerate(grouped_coverage.lines):
         spectrum_dict[method] = {
             'e_p': int(e_p[i]),
             'n_p': int(n_p[i]),
@@ -54,14 +57,72 @@ def make_spectrum_dict(bug_id):
     return spectrum_dict 
 
 
-method_level_spectrums = dict()
-
-for bug_id in tqdm(all_bugs):
-    method_level_spectrums[bug_id] = make_spectrum_dict(bug_id)
-
-spectrum_file = './method_level_spectrums.json'
-
-with open(spectrum_file, 'w') as f:
-    json.dump(method_level_spectrums, f, indent=4)
-
-
+def coverage_source(bug_id):
+    """
+    :return: SHA-256 of the coverage pickle the method coverage of a bug is built from.
+    """
+    return load_method_coverage(bug_id).source_hash
+
+
+def build_spectrum(bug_id):
+    """
+    Worker entry point: returns (bug_id, spectrum_dict, coverage hash, error message or None).
+    """
+    try:
+        return bug_id, make_spectrum_dict(bug_id), coverage_source(bug_id), None
+    except Exception as e:
+        return bug_id, None, None, f"{type(e).__name__}: {e}"
+
+
+def make_all_spectrums(bug_ids, store_dir=SPECTRUM_DIR, workers=None):
+    """
+    Computes the spectrum of every bug on a process pool. Each finished bug is written to
+    its own shard right away and recorded in the index with the hash of its coverage, so
+    a rerun only computes the bugs that have no shard yet or whose coverage changed.
+    :return: Finished bug ids, their coverage hashes and a dictionary of failed bugs
+             with their errors.
+    """
+    recorded = read_sources(store_dir)
+    sources = {}
+    for bug_id in bug_ids:
+        if has_spectrum(bug_id, store_dir) and bug_id in recorded and coverage_source(bug_id) == recorded[bug_id]:
+            sources[bug_id] = recorded[bug_id]
+    done = [bug_id for bug_id in bug_ids if bug_id in sources]
+    todo = [bug_id for bug_id in bug_ids if bug_id not in sources]
+    stale = [bug_id for bug_id in todo if has_spectrum(bug_id, store_dir)]
+    if done or stale:
+        print(f"Resuming: {len(done)} bugs already done, {len(stale)} with changed coverage, {len(todo)} left")
+
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build_spectrum, bug_id) for bug_id in todo]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            bug_id, spectrum, source, error = future.result()
+            if error is not None:
+                failures[bug_id] = error
+                tqdm.write(f"Failed {bug_id}: {error}")
+                continue
+            write_spectrum(bug_id, spectrum, store_dir)
+            sources[bug_id] = source
+            # Recorded right away, so an interrupted run resumes with the bugs finished so far
+            write_index([b for b in bug_ids if b in sources], store_dir, sources)
+
+    return [bug_id for bug_id in bug_ids if bug_id in sources], sources, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--fresh", action="store_true", help="recompute bugs that already have a shard")
+    args = parser.parse_args()
+
+    if args.fresh and os.path.isdir(SPECTRUM_DIR):
+        shutil.rmtree(SPECTRUM_DIR)
+
+    finished, sources, failures = make_all_spectrums(all_bugs, SPECTRUM_DIR, args.workers)
+    write_index(finished, SPECTRUM_DIR, sources)
+
+    if failures:
+        print(f"{len(failures)} bugs failed:")
+        for bug_id, error in failures.items():
+            print(f"  {bug_id}: {error}")
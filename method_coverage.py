@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+from coverage_store import (
+    CoverageStore,
+    load_coverage,
+    load_coverage_store,
+    load_valid_store,
+    pack_sparse,
+    save_coverage_store,
+    save_store_ids,
+    source_hash,
+)
+
+CACHE_DIR = "./method_coverage_cache"
+
+
+def aggregate_by_method(line_ids, line_coverage):
+    """
+    Segment-OR of line coverage into method coverage in a single sparse product.
+    Each line `method:lineno` is mapped to a method id and the (methods x lines)
+    indicator matrix is multiplied with the line coverage.
+    :param line_ids: Line ids in row order of line_coverage.
+    :param line_coverage: (lines x tests) boolean matrix, sparse or dense.
+    :return: Sorted method names and a (methods x tests) CSR boolean matrix.
+    """
+    methods, method_ids = np.unique(
+        np.array([line.split(":")[0] for line in line_ids], dtype=object), return_inverse=True
+    )
+    indicator = sp.csr_matrix(
+        (np.ones(len(method_ids), dtype=np.int32), (method_ids, np.arange(len(method_ids)))),
+        shape=(len(methods), len(method_ids)),
+    )
+    grouped = (indicator @ sp.csr_matrix(line_coverage, dtype=np.int32)).tocsr()
+    grouped.eliminate_zeros()
+    return methods.tolist(), grouped.astype(bool)
+
+
+def build_method_coverage(bug_id, data_dir="./bug_data", pickle_hash=None):
+    """
+    Groups the line level coverage of a bug into a method x test coverage matrix.
+    A method covers a test if any of its lines does.
+    :param pickle_hash: SHA-256 of the pickle; the line store is reconverted unless
+                        it was built from that content.
+    :return: CoverageStore whose rows are methods.
+    """
+    coverage = load_coverage(bug_id, data_dir, pickle_hash=pickle_hash)
+    methods, grouped_coverage = aggregate_by_method(coverage.lines, coverage.to_sparse())
+    return CoverageStore(
+        methods, list(coverage.tests), pack_sparse(grouped_coverage), coverage.source_hash, coverage.source_stat
+    )
+
+
+def load_method_coverage(bug_id, data_dir="./bug_data", cache_dir=CACHE_DIR):
+    """
+    Returns the method x test coverage of a bug from the cache. The cache entry is
+    rebuilt only when the content hash of `{bug_id}-cov.pkl` changed; the pickle is
+    only hashed when its size or mtime changed. Without the pickle the cache entry is
+    used as is, or built from the line coverage store.
+    :return: CoverageStore whose rows are methods.
+    """
+    pickle_path = os.path.join(data_dir, f"{bug_id}-cov.pkl")
+    cached = load_valid_store(bug_id, cache_dir)
+
+    if not os.path.exists(pickle_path):
+        if cached is not None:
+            return cached
+        pickle_hash = None
+    else:
+        pickle_hash, stat = source_hash(pickle_path, cached)
+        if cached is not None and cached.source_hash == pickle_hash:
+            if cached.source_stat != stat:
+                cached.source_stat = stat
+                save_store_ids(cached, bug_id, cache_dir)
+            return cached
+
+    method_coverage = build_method_coverage(bug_id, data_dir, pickle_hash)
+    save_coverage_store(method_coverage, bug_id, cache_dir)
+    return load_coverage_store(bug_id, cache_dir)
+
+
+if __name__ == "__main__":
+    all_bugs = [
+        fname[:-len("-cov.pkl")]
+        for fname in sorted(os.listdir("./bug_data"))
+        if fname.endswith("-cov.pkl")
+    ]
+    for bug_id in tqdm(all_bugs):
+        load_method_coverage(bug_id)
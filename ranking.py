@@ -0,0 +1,105 @@
+import numpy as np
+
+# How methods with the same score are ranked:
+#   stable  - in method order, the position Python's sorted(..., reverse=True) gives (default)
+#   best    - every tied method gets the best position of its tie group
+#   worst   - every tied method gets the worst position of its tie group
+#   average - every tied method gets the mean position of its tie group
+#   dense   - rank of the distinct score (1 + number of distinct higher scores)
+TIE_POLICIES = ("stable", "best", "worst", "average", "dense")
+
+
+def buggy_ranks(scores, buggy_indices, ties="stable"):
+    """
+    Ranks (1 = most suspicious) of the buggy methods without sorting the scores.
+    With ties="stable" the rank of a method is 1 + the number of higher scores + the
+    number of equal scores that come before it, which is exactly the position a stable
+    descending sort would give it. The other policies only depend on the tie groups,
+    which are counted in one np.unique pass.
+    :param scores: Score of every method, in method order.
+    :param buggy_indices: Positions of the buggy methods in the method order.
+    :param ties: One of TIE_POLICIES.
+    :return: Array with one rank per buggy index (float for "average", int otherwise).
+    """
+    if ties not in TIE_POLICIES:
+        raise ValueError(f"Unknown tie policy: {ties}, expected one of {TIE_POLICIES}")
+    scores = np.asarray(scores, dtype=np.float64)
+    buggy_indices = np.asarray(buggy_indices, dtype=np.intp)
+
+    if ties == "stable":
+        buggy_scores = scores[buggy_indices][:, None]
+        higher = np.count_nonzero(scores > buggy_scores, axis=1)
+        earlier_ties = np.count_nonzero(
+            (scores == buggy_scores) & (np.arange(len(scores)) < buggy_indices[:, None]), axis=1
+        )
+        return higher + earlier_ties + 1
+
+    # unique 값은 오름차순이므로 뒤에서부터 누적하면 더 높은 점수의 개수가 된다
+    unique, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    groups = inverse.reshape(-1)[buggy_indices]
+    higher = (np.cumsum(counts[::-1])[::-1] - counts)[groups]
+    equal = counts[groups]
+
+    if ties == "best":
+        return higher + 1
+    if ties == "worst":
+        return higher + equal
+    if ties == "average":
+        return higher + (equal + 1) / 2
+    return len(unique) - groups
+
+
+def best_rank(scores, buggy_indices, ties="stable"):
+    """
+    Rank of the best ranked buggy method, see buggy_ranks.
+    """
+    if len(buggy_indices) == 0:
+        raise ValueError("No buggy method to rank")
+    rank = buggy_ranks(scores, buggy_indices, ties).min()
+    return float(rank) if ties == "average" else int(rank)
+
+
+def buggy_rank_matrix(scores, buggy_indices, ties="stable"):
+    """
+    buggy_ranks of many score vectors of the same methods at once, e.g. the scores
+    of a whole GP population on one bug. Every rank is counted with the same
+    comparisons as buggy_ranks, vectorized over the rows, so both give the same ranks.
+    :param scores: (rows x methods) score matrix.
+    :param buggy_indices: Positions of the buggy methods in the method order.
+    :return: (rows x buggy methods) array of ranks (float for "average", int otherwise).
+    """
+    if ties not in TIE_POLICIES:
+        raise ValueError(f"Unknown tie policy: {ties}, expected one of {TIE_POLICIES}")
+    scores = np.asarray(scores, dtype=np.float64)
+    buggy_indices = np.asarray(buggy_indices, dtype=np.intp)
+    buggy_scores = scores[:, buggy_indices][:, :, None]
+
+    if ties == "stable":
+        higher = np.count_nonzero(scores[:, None, :] > buggy_scores, axis=2)
+        earlier = np.arange(scores.shape[1]) < buggy_indices[:, None]
+        earlier_ties = np.count_nonzero((scores[:, None, :] == buggy_scores) & earlier, axis=2)
+        return higher + earlier_ties + 1
+
+    # np.unique 처럼 NaN은 하나의 그룹이고 가장 높은 점수로 취급
+    buggy_scores = buggy_scores[:, :, 0]
+    nan = np.isnan(scores)
+    buggy_nan = np.isnan(buggy_scores)
+    nan_count = np.count_nonzero(nan, axis=1)[:, None]
+
+    if ties == "dense":
+        ordered = np.sort(scores, axis=1)
+        first = np.ones_like(ordered, dtype=bool)
+        first[:, 1:] = (ordered[:, 1:] != ordered[:, :-1]) & ~(np.isnan(ordered[:, 1:]) & np.isnan(ordered[:, :-1]))
+        distinct = np.count_nonzero(first, axis=1)[:, None]
+        lower = np.count_nonzero(first[:, None, :] & (ordered[:, None, :] < buggy_scores[:, :, None]), axis=2)
+        return distinct - np.where(buggy_nan, distinct - 1, lower)
+
+    higher = np.count_nonzero(scores[:, None, :] > buggy_scores[:, :, None], axis=2)
+    higher = np.where(buggy_nan, 0, higher + nan_count)
+    equal = np.where(buggy_nan, nan_count, np.count_nonzero(scores[:, None, :] == buggy_scores[:, :, None], axis=2))
+
+    if ties == "best":
+        return higher + 1
+    if ties == "worst":
+        return higher + equal
+    return higher + (equal + 1) / 2
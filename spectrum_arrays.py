@@ -0,0 +1,52 @@
+import json
+import numpy as np
+
+COUNT_COLUMNS = ("e_p", "n_p", "e_f", "n_f")
+
+
+class BugSpectrum:
+    """
+    Columnar spectrum of one bug: a method name array plus one array per spectrum value.
+    e_p, n_p, e_f, n_f are int32 and p (P(Fail|Node), 0.0 when absent) is float64.
+    """
+    def __init__(self, bug_id, methods, e_p, n_p, e_f, n_f, p):
+        self.bug_id = bug_id
+        self.methods = methods
+        self.e_p = e_p
+        self.n_p = n_p
+        self.e_f = e_f
+        self.n_f = n_f
+        self.p = p
+
+    def __len__(self):
+        return len(self.methods)
+
+    def columns(self):
+        """
+        :return: Dictionary column name -> array, e.g. as the namespace of a formula.
+        """
+        return {"e_p": self.e_p, "n_p": self.n_p, "e_f": self.e_f, "n_f": self.n_f, "p": self.p}
+
+    @classmethod
+    def from_dict(cls, bug_id, spectrum):
+        """
+        Builds the columns from a method -> spectra dictionary of one bug.
+        """
+        methods = np.array(list(spectrum.keys()), dtype=object)
+        rows = list(spectrum.values())
+        counts = np.array(
+            [[row.get(column, 0) for column in COUNT_COLUMNS] for row in rows], dtype=np.int32
+        ).reshape(len(rows), len(COUNT_COLUMNS))
+        p = np.array([row.get("p", 0.0) for row in rows], dtype=np.float64)
+        return cls(bug_id, methods, *(np.ascontiguousarray(counts[:, i]) for i in range(len(COUNT_COLUMNS))), p)
+
+
+def load_spectrum_json(json_file):
+    """
+    Loads a monolithic spectrum JSON (method_level_spectrums.json or new_spectrum.json).
+    :return: Dictionary bug_id -> BugSpectrum, in file order.
+    """
+    with open(json_file, "r") as f:
+        spectrum_data = json.load(f)
+    return {bug_id: BugSpectrum.from_dict(bug_id, spectrum) for bug_id, spectrum in spectrum_data.items()}
+
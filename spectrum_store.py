@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+
+SPECTRUM_DIR = "./method_level_spectrums"
+INDEX_FILE = "index.json"
+
+
+def shard_path(bug_id, store_dir=SPECTRUM_DIR):
+    return os.path.join(store_dir, f"{bug_id}.json")
+
+
+def write_spectrum(bug_id, spectrum, store_dir=SPECTRUM_DIR):
+    """
+    Writes one bug's spectrum as a compact JSON record. The shard is written to a
+    temporary file first, so an interrupted run never leaves a half written shard.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = shard_path(bug_id, store_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(spectrum, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def write_index(bug_ids, store_dir=SPECTRUM_DIR, sources=None):
+    """
+    Writes the index of the store: bug ids in iteration order.
+    :param sources: Dictionary bug_id -> SHA-256 of the coverage its shard was computed from.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, INDEX_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"bugs": list(bug_ids), "sources": dict(sources or {})}, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def read_index(store_dir=SPECTRUM_DIR):
+    with open(os.path.join(store_dir, INDEX_FILE), "r") as f:
+        return json.load(f)["bugs"]
+
+
+def read_sources(store_dir=SPECTRUM_DIR):
+    """
+    :return: Dictionary bug_id -> coverage hash recorded in the index, empty without an index.
+    """
+    path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("sources", {})
+
+
+def has_spectrum(bug_id, store_dir=SPECTRUM_DIR):
+    return os.path.exists(shard_path(bug_id, store_dir))
+
+
+def read_spectrum(bug_id, store_dir=SPECTRUM_DIR):
+    """
+    :return: Dictionary method -> {'e_p', 'n_p', 'e_f', 'n_f', ...} of one bug.
+    """
+    with open(shard_path(bug_id, store_dir), "r") as f:
+        return json.load(f)
+
+
+def iter_spectra(store_dir=SPECTRUM_DIR, bug_ids=None):
+    """
+    Lazily yields (bug_id, spectra) pairs, reading one shard at a time.
+    :param bug_ids: Bugs to read, defaults to every bug in the index.
+    """
+    if bug_ids is None:
+        bug_ids = read_index(store_dir)
+    for bug_id in bug_ids:
+        yield bug_id, read_spectrum(bug_id, store_dir)
+
+
+def import_json(json_file, store_dir):
+    """
+    Splits a monolithic spectrum JSON file (e.g. new_spectrum.json) into a sharded store.
+    """
+    with open(json_file, "r") as f:
+        spectrum_data = json.load(f)
+    for bug_id, spectrum in spectrum_data.items():
+        write_spectrum(bug_id, spectrum, store_dir)
+    write_index(spectrum_data.keys(), store_dir)
+
+
+if __name__ == "__main__":
+    # python spectrum_store.py new_spectrum.json ./new_spectrum
+    import_json(sys.argv[1], sys.argv[2])
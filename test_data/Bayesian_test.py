@@ -1,9 +1,13 @@
 import os
+import sys
 import json
 import networkx as nx
 import pandas as pd
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from method_coverage import aggregate_by_method
+
 
 all_bugs = [
     os.path.splitext(fname)[0]
@@ -163,19 +167,9 @@ for chart_key, methods in spectrum_data.items():
     # print(coverage.dtypes) 
     # print(coverage)
     print(coverage.head)
-    coverage.index = coverage.index.str.split(":").str[0]
-
-    coverage_bool = coverage.astype(bool)
-
-    unique_indices = coverage_bool.index.unique()
-
-    grouped_coverage = {}
-    for index in unique_indices:
-        subset = coverage_bool[coverage_bool.index == index]
-        result = subset.any(axis=0)
-        grouped_coverage[index] = result
+    methods, grouped_coverage = aggregate_by_method(coverage.index, coverage.to_numpy(dtype=bool))
 
-    grouped_coverage_df = pd.DataFrame.from_dict(grouped_coverage, orient="index")
+    grouped_coverage_df = pd.DataFrame(grouped_coverage.toarray(), index=methods, columns=coverage.columns)
 
     grouped_coverage_df.index.name = "method"
     grouped_coverage_df.columns.name = "tests"
@@ -1,26 +1,27 @@
 import os
+import sys
 import json
-import pandas as pd
 import numpy as np
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from method_coverage import load_method_coverage
+
 
 def get_method_test_dict(bug_id):
     method_test_dict = {}
 
     bug_info_path = os.path.join(f"./bug_data/{bug_id}.json") 
-    coverage_path = os.path.join(f"./bug_data/{bug_id}-cov.pkl")
 
     with open(bug_info_path, "r") as f:
         bug_info = json.load(f)
 
-    coverage = pd.read_pickle(coverage_path)
-    coverage.index = coverage.index.str.split(":").str[0]
-    
-    grouped_coverage = coverage.groupby(coverage.index).any()
+    grouped_coverage = load_method_coverage(bug_id)
+    coverage = grouped_coverage.to_sparse()
+    tests = np.array(grouped_coverage.tests, dtype=object)
 
-    for method, coverage in grouped_coverage.iterrows():
-        covering_tests = grouped_coverage.columns[coverage].tolist()
+    for i, method in enumerate(grouped_coverage.lines):
+        covering_tests = tests[coverage.indices[coverage.indptr[i]:coverage.indptr[i + 1]]].tolist()
 
         method_test_dict[method] = covering_tests
     